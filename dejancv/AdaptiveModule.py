@@ -0,0 +1,133 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def defaultLevels(complexities=(1, 0), scales=(1, 0.75, 0.5, 0.35)):
+
+    # Quality levels from best to cheapest: drop the model complexity first at full resolution,
+    # then shrink the input at the lowest complexity. Every step is cheaper than the one before.
+    levels = [(scales[0], c) for c in complexities]
+    levels += [(s, complexities[-1]) for s in scales[1:]]
+    return levels
+
+
+class AdaptiveController:
+
+    def __init__(self, detector, targetFrameTime=1 / 30, levels=None, upper=1.1, lower=0.7,
+                 patienceDown=10, patienceUp=60, smoothing=0.2):
+
+        self.detector = detector
+        self.targetFrameTime = targetFrameTime  # Seconds per frame we try to hold
+        if levels is None:
+            # Detectors without a model complexity (FaceMeshDetector) only step the scale
+            levels = defaultLevels() if hasattr(detector, "modelComplexity") else defaultLevels((None,))
+        self.levels = levels  # (processScale, modelComplexity) pairs, best quality first
+        self.upper = upper  # Step down when the smoothed frame time stays above target * upper
+        self.lower = lower  # Step up when it stays below target * lower, the gap between the two is the hysteresis
+        self.patienceDown = patienceDown  # Frames over budget before stepping down
+        self.patienceUp = patienceUp  # Frames under budget before stepping up, longer so we don't oscillate
+        self.smoothing = smoothing  # EMA weight of the newest frame time
+
+        self.level = self.findLevel()
+        self.frameTime = None
+        self.overCount = 0
+        self.underCount = 0
+        self.decisions = []  # Every level change, for later inspection
+
+    def findLevel(self):
+
+        # Start from the level closest to how the detector is configured now
+        current = (self.detector.processScale, getattr(self.detector, "modelComplexity", None))
+        for i, level in enumerate(self.levels):
+            if level == current:
+                return i
+        self.apply(0)
+        return 0
+
+    def apply(self, index):
+
+        scale, complexity = self.levels[index]
+        self.detector.processScale = scale
+        if complexity is not None and complexity != self.detector.modelComplexity:
+            self.detector.setModelComplexity(complexity)
+
+    def update(self, frameTime=None, fps=None):
+
+        # Feed one measurement per frame: a frame time in seconds, or an FPS object (its latest frame time is used).
+        # Returns the current (processScale, modelComplexity).
+        if frameTime is None:
+            frameTime = fps.frameTimes[-1]
+        if self.frameTime is None:
+            self.frameTime = frameTime
+        else:
+            self.frameTime += self.smoothing * (frameTime - self.frameTime)
+
+        if self.frameTime > self.targetFrameTime * self.upper:
+            self.overCount += 1
+            self.underCount = 0
+        elif self.frameTime < self.targetFrameTime * self.lower:
+            self.underCount += 1
+            self.overCount = 0
+        else:
+            self.overCount = self.underCount = 0
+
+        if self.overCount >= self.patienceDown and self.level < len(self.levels) - 1:
+            self.change(self.level + 1, "over budget")
+        elif self.underCount >= self.patienceUp and self.level > 0:
+            self.change(self.level - 1, "under budget")
+        return self.levels[self.level]
+
+    def change(self, index, reason):
+
+        old = self.levels[self.level]
+        self.apply(index)
+        self.level = index
+        decision = {"time": time.time(), "from": old, "to": self.levels[index], "reason": reason,
+                    "frameTime": self.frameTime, "target": self.targetFrameTime}
+        self.decisions.append(decision)
+        logger.info("%s: %.1f ms vs %.1f ms target, scale/complexity %s -> %s", reason,
+                    self.frameTime * 1000, self.targetFrameTime * 1000, old, self.levels[index])
+
+        # Measurements from the old level no longer apply, start counting afresh
+        self.overCount = self.underCount = 0
+        self.frameTime = None
+
+    def setTarget(self, targetFrameTime):
+
+        self.targetFrameTime = targetFrameTime
+        self.overCount = self.underCount = 0
+
+
+def main():
+    import cv2
+    from dejancv.FPS import FPS
+    from dejancv.HandTrackingModule import HandDetector
+
+    cap = cv2.VideoCapture(0)
+    detector = HandDetector(maxHands=2, modelComplexity=1)
+    fpsReader = FPS(avgCount=30)
+
+    # Hold 30 FPS: the controller lowers the complexity, then the resolution, when frames take too long
+    controller = AdaptiveController(detector, targetFrameTime=1 / 30)
+
+    while True:
+        success, img = cap.read()
+        hands, img = detector.findHands(img, draw=True)
+
+        fps, img = fpsReader.update(img)
+        scale, complexity = controller.update(fps=fpsReader)
+        cv2.putText(img, f"scale {scale} complexity {complexity}", (20, 100),
+                    cv2.FONT_HERSHEY_PLAIN, 2, (255, 0, 255), 2)
+
+        cv2.imshow("Image", img)
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            break
+
+    for decision in controller.decisions:
+        print(decision)
+
+
+if __name__ == "__main__":
+    main()
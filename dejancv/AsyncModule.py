@@ -0,0 +1,145 @@
+import asyncio
+import collections
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+DROP = "drop"  # Only the newest waiting frame is kept, older waiting callers get FrameDropped
+QUEUE = "queue"  # Frames wait in order, callers are held back (awaiting) while maxQueue frames are waiting
+
+
+class FrameDropped(Exception):
+
+    pass
+
+
+class AsyncDetector:
+
+    def __init__(self, detector, policy=DROP, maxQueue=4):
+
+        # Wraps any detector (HandDetector, FaceMeshDetector, PoseDetector, FaceDetector, SelfiSegmentation,
+        # Classifier): every method becomes awaitable, e.g. await asyncHands.findHands(img, draw=False).
+        if policy not in (DROP, QUEUE):
+            raise ValueError(f"Unknown policy '{policy}', use '{DROP}' or '{QUEUE}'")
+        self.detector = detector
+        self.policy = policy
+        self.maxQueue = maxQueue
+
+        # One thread per detector: MediaPipe graphs are not thread safe and need frames in order
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = collections.deque()
+        self.wake = None
+        self.space = None
+        self.worker = None
+        self.stats = {"submitted": 0, "completed": 0, "dropped": 0, "cancelled": 0}
+
+    def __getattr__(self, name):
+
+        attr = getattr(self.detector, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def method(*args, **kwargs):
+            return await self.submit(attr, *args, **kwargs)
+        return method
+
+    def start(self):
+
+        # Created on first use, so the wrapper can be built outside the event loop
+        if self.worker is None or self.worker.done():
+            self.wake = asyncio.Event()
+            self.space = asyncio.Condition()
+            self.worker = asyncio.get_running_loop().create_task(self.run())
+
+    async def submit(self, fn, *args, **kwargs):
+
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self.stats["submitted"] += 1
+
+        if self.policy == DROP:
+            while self.pending:
+                old = self.pending.popleft()[0]
+                if not old.done():
+                    old.set_exception(FrameDropped())
+                    self.stats["dropped"] += 1
+        else:
+            async with self.space:
+                await self.space.wait_for(lambda: len(self.pending) < self.maxQueue)
+
+        self.pending.append((future, functools.partial(fn, *args, **kwargs)))
+        self.wake.set()
+        try:
+            return await future
+        except asyncio.CancelledError:
+            # Still waiting: the worker skips it. Already running: the thread finishes and the result is discarded.
+            future.cancel()
+            self.stats["cancelled"] += 1
+            raise
+
+    async def run(self):
+
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.wake.wait()
+            while self.pending:
+                future, call = self.pending.popleft()
+                async with self.space:
+                    self.space.notify()
+                if future.done():
+                    continue
+                try:
+                    result = await loop.run_in_executor(self.executor, call)
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                    continue
+                if not future.done():
+                    future.set_result(result)
+                    self.stats["completed"] += 1
+            self.wake.clear()
+
+    async def close(self):
+
+        if self.worker is not None:
+            self.worker.cancel()
+            for future, _ in self.pending:
+                future.cancel()
+            self.pending.clear()
+        self.executor.shutdown(wait=False)
+
+
+def main():
+    import cv2
+    from dejancv import DrawModule
+    from dejancv.HandTrackingModule import HandDetector
+
+    # Annotations are drawn on the executor threads, so draw right away or not at all
+    DrawModule.setHeadless()
+
+    async def stream(camera):
+        cap = cv2.VideoCapture(camera)
+        hands = AsyncDetector(HandDetector(maxHands=2), policy=DROP)
+        frames = 0
+        while frames < 300:
+            success, img = await asyncio.to_thread(cap.read)
+            if not success:
+                break
+            try:
+                found, img = await hands.findHands(img, draw=False)
+            except FrameDropped:
+                continue
+            frames += 1
+            print(camera, len(found))
+        await hands.close()
+        print(camera, hands.stats)
+
+    # One event loop drives every camera, detection never blocks it
+    async def run():
+        await asyncio.gather(stream(0), stream(1))
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,200 @@
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future
 
 import cv2
 import numpy as np
-import tensorflow
+
+from dejancv import MetricsModule
+from dejancv.Utils import putTextCached
+
+logger = logging.getLogger(__name__)
+
+
+class KerasBackend:
+
+    def __init__(self, modelPath, numThreads=None):
+
+        # TensorFlow is only imported when this backend is used
+        import tensorflow
+        if numThreads:
+            # Only possible before TensorFlow starts its runtime, later models share the first setting
+            try:
+                tensorflow.config.threading.set_intra_op_parallelism_threads(numThreads)
+            except RuntimeError:
+                logger.warning("numThreads=%d not applied, TensorFlow is already running with %d threads",
+                               numThreads, tensorflow.config.threading.get_intra_op_parallelism_threads())
+        self.model = tensorflow.keras.models.load_model(modelPath)
+        self.inputSize = tuple(self.model.input_shape[1:3])
+
+    def predict(self, data):
+
+        # Calling the model directly skips the per-call setup of model.predict
+        return np.asarray(self.model(data, training=False))
+
+
+class TFLiteBackend:
+
+    # Changing the batch size of an interpreter reallocates all its tensors, so BatchingClassifier pads its
+    # batches to one size instead of sending whatever number of requests it collected
+    padBatches = True
+
+    def __init__(self, modelPath, numThreads=None):
+
+        # Prefer the small tflite-runtime package, fall back to the interpreter bundled with TensorFlow
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+        self.Interpreter = Interpreter
+        self.modelPath = modelPath
+        self.numThreads = numThreads
+        self.model = Interpreter(model_path=modelPath, num_threads=numThreads)
+        self.model.allocate_tensors()
+        self.input = self.model.get_input_details()[0]
+        self.output = self.model.get_output_details()[0]
+        self.inputSize = tuple(self.input["shape"][1:3])
+
+        # One interpreter per batch size, each allocated once: single frames and batches never resize each other
+        self.interpreters = {int(self.input["shape"][0]): self.model}
+        self.lock = threading.Lock()
+
+    def getInterpreter(self, batchSize):
+
+        with self.lock:
+            model = self.interpreters.get(batchSize)
+            if model is None:
+                model = self.Interpreter(model_path=self.modelPath, num_threads=self.numThreads)
+                model.resize_tensor_input(self.input["index"], [batchSize, *self.input["shape"][1:]])
+                model.allocate_tensors()
+                self.interpreters[batchSize] = model
+        return model
+
+    def predict(self, data):
+
+        model = self.getInterpreter(len(data))
+
+        # Quantized models take integers, convert our [-1, 1] floats with the model's own scale
+        scale, zeroPoint = self.input["quantization"]
+        if self.input["dtype"] != np.float32 and scale:
+            data = np.clip(np.round(data / scale + zeroPoint), np.iinfo(self.input["dtype"]).min,
+                           np.iinfo(self.input["dtype"]).max).astype(self.input["dtype"])
+
+        model.set_tensor(self.input["index"], data)
+        model.invoke()
+        prediction = model.get_tensor(self.output["index"])
+
+        scale, zeroPoint = self.output["quantization"]
+        if self.output["dtype"] != np.float32 and scale:
+            prediction = (prediction.astype(np.float32) - zeroPoint) * scale
+        return prediction
+
+
+class OnnxBackend:
+
+    def __init__(self, modelPath, numThreads=None):
+
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        if numThreads:
+            options.intra_op_num_threads = numThreads
+        self.model = onnxruntime.InferenceSession(modelPath, options, providers=["CPUExecutionProvider"])
+        self.input = self.model.get_inputs()[0]
+
+        # Exports from Keras keep NHWC, exports from other frameworks are often NCHW
+        shape = self.input.shape
+        self.channelsFirst = shape[1] == 3
+        self.inputSize = tuple(shape[2:4] if self.channelsFirst else shape[1:3])
+        self.fixedBatch = shape[0] if isinstance(shape[0], int) else None  # None when the batch size is dynamic
+
+    def predict(self, data):
+
+        if self.channelsFirst:
+            data = np.ascontiguousarray(data.transpose(0, 3, 1, 2))
+        if self.fixedBatch and len(data) != self.fixedBatch:
+            # Exported with a fixed batch size, run the batch in chunks of that size
+            return np.concatenate([self.model.run(None, {self.input.name: data[i:i + self.fixedBatch]})[0]
+                                   for i in range(0, len(data), self.fixedBatch)])
+        return self.model.run(None, {self.input.name: data})[0]
+
+
+class ChangeGate:
+
+    def __init__(self, threshold=2.0, maxAge=1.0, size=16):
+
+        self.threshold = threshold  # Mean change of the thumbnail in gray levels (0-255) that forces a new inference
+        self.maxAge = maxAge  # Seconds after which a cached prediction is refreshed even on a static scene
+        self.size = size  # Thumbnail side used as fingerprint
+        self.fingerprint = None
+        self.result = None
+        self.time = 0
+        self.hits = 0
+        self.misses = 0
+
+    def getFingerprint(self, data):
+
+        # Downsampled grayscale of the preprocessed input, back in 0-255 units
+        thumb = cv2.resize(data, (self.size, self.size), interpolation=cv2.INTER_AREA)
+        return thumb.mean(axis=2) * 127.0
+
+    def lookup(self, data):
+
+        # Returns (fingerprint, cached result or None)
+        fingerprint = self.getFingerprint(data)
+        if self.result is not None and time.time() - self.time < self.maxAge:
+            if float(np.abs(fingerprint - self.fingerprint).mean()) < self.threshold:
+                self.hits += 1
+                return fingerprint, self.result
+        self.misses += 1
+        return fingerprint, None
+
+    def store(self, fingerprint, result):
+
+        self.fingerprint = fingerprint
+        self.result = result
+        self.time = time.time()
+
+    def reset(self):
+
+        self.fingerprint = None
+        self.result = None
+
+    def getStats(self):
+
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hitRate": self.hits / total if total else 0.0}
+
+
+BACKENDS = {"keras": KerasBackend, "tflite": TFLiteBackend, "onnx": OnnxBackend}
+EXTENSIONS = {".h5": "keras", ".keras": "keras", ".tflite": "tflite", ".onnx": "onnx"}
 
 
 class Classifier:
 
-    def __init__(self, modelPath, labelsPath=None):
+    def __init__(self, modelPath, labelsPath=None, backend=None, numThreads=None, warmup=True, gate=None):
 
         self.model_path = modelPath
+        self.gate = gate  # Optional ChangeGate, reuses the last prediction while the input barely changes
         np.set_printoptions(suppress=True)  # Disable scientific notation for clarity
 
-        # Load the Keras model
-        self.model = tensorflow.keras.models.load_model(self.model_path)
+        # Pick the runtime from the file extension unless one is given: 'keras', 'tflite' or 'onnx'
+        if backend is None:
+            backend = EXTENSIONS.get(os.path.splitext(modelPath)[1].lower(), "keras")
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', use one of {list(BACKENDS)}")
+        self.backendName = backend
+        self.backend = BACKENDS[backend](modelPath, numThreads)
+        self.model = self.backend.model
 
-        # Create a NumPy array with the right shape to feed into the Keras model
-        self.data = np.ndarray(shape=(1, 224, 224, 3), dtype=np.float32)
+        # Create a NumPy array with the right shape to feed into the model
+        h, w = (int(v) if isinstance(v, (int, np.integer)) and v > 0 else 224 for v in self.backend.inputSize)
+        self.inputSize = (w, h)
+        self.data = np.ndarray(shape=(1, h, w, 3), dtype=np.float32)
 
         self.labels_path = labelsPath
 
@@ -27,35 +206,312 @@ class Classifier:
         else:
             print("No Labels Found")
 
-    def getPrediction(self, img, draw=True, pos=(50, 50), scale=2, color=(0, 255, 0)):
+        # The first inference allocates and optimizes, pay for it now instead of on the first frame
+        if warmup:
+            self.data[:] = 0
+            self.backend.predict(self.data)
+
+    def preprocess(self, img):
 
         # Resize and normalize the image
-        imgS = cv2.resize(img, (224, 224))
+        imgS = cv2.resize(img, self.inputSize)
         image_array = np.asarray(imgS)
         normalized_image_array = (image_array.astype(np.float32) / 127.0) - 1
+        return normalized_image_array
+
+    def predictData(self, normalized_image_array):
+
+        # Skip the model when the gate says the input hasn't changed enough
+        if self.gate is not None:
+            fingerprint, cached = self.gate.lookup(normalized_image_array)
+            if cached is not None:
+                return cached
+            result = self.runModel(normalized_image_array)
+            self.gate.store(fingerprint, result)
+            return result
+        return self.runModel(normalized_image_array)
+
+    def runModel(self, normalized_image_array):
 
         # Load the image into the data array
         self.data[0] = normalized_image_array
 
         # Run inference
-        prediction = self.model.predict(self.data)
+        prediction = self.backend.predict(self.data)
         indexVal = np.argmax(prediction)
+        return prediction, indexVal
+
+    def getPrediction(self, img, draw=True, pos=(50, 50), scale=2, color=(0, 255, 0)):
+
+        timer = MetricsModule.timer("Classifier.getPrediction")
+        data = self.preprocess(img)
+        timer.lap("preprocess")
+        prediction, indexVal = self.predictData(data)
+        timer.lap("inference")
 
         # Draw the prediction text on the image if specified
         if draw and self.labels_path:
-            cv2.putText(img, str(self.list_labels[indexVal]), pos, cv2.FONT_HERSHEY_COMPLEX, scale, color, 2)
+            putTextCached(img, str(self.list_labels[indexVal]), pos, cv2.FONT_HERSHEY_COMPLEX, scale, color, 2)
 
+        timer.end()
         return list(prediction[0]), indexVal
 
 
-if __name__ == "__main__":
+class AsyncClassifier:
+
+    def __init__(self, classifier, callback=None):
+
+        self.classifier = classifier
+        self.callback = callback  # Optional callback(prediction, indexVal, frameId), called on the worker thread
+
+        self.condition = threading.Condition()
+        self.pending = None  # Only the most recent frame waits, older ones are dropped
+        self.running = True
+        self.frameCount = 0
+        self.stats = {"submitted": 0, "processed": 0, "dropped": 0, "lastLatency": 0.0, "lastFramesBehind": 0}
+
+        self.thread = threading.Thread(target=self.worker, daemon=True)
+        self.thread.start()
+
+    def submit(self, img, frameId=None):
+
+        # Preprocessing happens here: it is cheap and leaves the worker a private copy,
+        # so the caller is free to draw on img right away.
+        data = self.classifier.preprocess(img)
+        future = Future()
+
+        with self.condition:
+            if not self.running:
+                # Closed: nothing will ever run it
+                future.cancel()
+                return future
+            self.frameCount += 1
+            frameId = self.frameCount if frameId is None else frameId
+            if self.pending is not None:
+                # The worker hasn't started on it yet, so it is stale now
+                self.pending[3].cancel()
+                self.stats["dropped"] += 1
+            self.pending = (data, frameId, self.frameCount, future, time.perf_counter())
+            self.stats["submitted"] += 1
+            self.condition.notify()
+        return future
+
+    def worker(self):
+
+        while True:
+            with self.condition:
+                while self.pending is None and self.running:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                data, frameId, frameNumber, future, submitTime = self.pending
+                self.pending = None
+
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                prediction, indexVal = self.classifier.predictData(data)
+                result = (list(prediction[0]), indexVal, frameId)
+            except Exception as e:
+                future.set_exception(e)
+                continue
+
+            with self.condition:
+                self.stats["processed"] += 1
+                self.stats["lastLatency"] = time.perf_counter() - submitTime
+                self.stats["lastFramesBehind"] = self.frameCount - frameNumber
+            future.set_result(result)
+            if self.callback is not None:
+                # A failing callback must not stop the worker, later futures would never resolve
+                try:
+                    self.callback(*result)
+                except Exception:
+                    logger.exception("AsyncClassifier callback failed")
+
+    def getStats(self):
+
+        # queueDepth is 0 or 1, lastFramesBehind is how many newer frames arrived while the last one ran
+        with self.condition:
+            return dict(self.stats, queueDepth=int(self.pending is not None))
+
+    def close(self):
+
+        with self.condition:
+            self.running = False
+            if self.pending is not None:
+                self.pending[3].cancel()
+                self.pending = None
+            self.condition.notify()
+        self.thread.join()
+
+
+class BatchingClassifier:
+
+    def __init__(self, classifier, maxBatch=8, maxWait=0.005):
+
+        # Requests from many threads (e.g. clients of a server) are run together as one batch
+        self.classifier = classifier
+        self.maxBatch = maxBatch
+        self.maxWait = maxWait  # Seconds the first request of a batch waits for others to join it
+
+        self.condition = threading.Condition()
+        self.queue = []
+        self.running = True
+        self.stats = {"requests": 0, "batches": 0, "largestBatch": 0}
+
+        self.thread = threading.Thread(target=self.worker, daemon=True)
+        self.thread.start()
+
+    def submit(self, img):
+
+        # Returns a Future resolving to (prediction list, indexVal); preprocessing runs on the calling thread
+        data = self.classifier.preprocess(img)
+        future = Future()
+        with self.condition:
+            self.queue.append((data, future))
+            self.stats["requests"] += 1
+            self.condition.notify()
+        return future
+
+    def predict(self, img):
+
+        return self.submit(img).result()
+
+    def worker(self):
+
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.queue or not self.running)
+                if not self.running:
+                    return
+                # Give other requests up to maxWait to arrive, unless the batch is already full
+                deadline = time.perf_counter() + self.maxWait
+                while len(self.queue) < self.maxBatch and self.running:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                items, self.queue = self.queue[:self.maxBatch], self.queue[self.maxBatch:]
+
+            items = [(data, future) for data, future in items if future.set_running_or_notify_cancel()]
+            if not items:
+                continue
+            batch = np.stack([data for data, _ in items])
+            if getattr(self.classifier.backend, "padBatches", False) and len(batch) < self.maxBatch:
+                # Always the same batch size for backends that reallocate on every size change
+                batch = np.concatenate([batch, np.zeros((self.maxBatch - len(batch), *batch.shape[1:]), batch.dtype)])
+            try:
+                predictions = self.classifier.backend.predict(batch)
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+
+            self.stats["batches"] += 1
+            self.stats["largestBatch"] = max(self.stats["largestBatch"], len(items))
+            for (_, future), prediction in zip(items, predictions):
+                future.set_result((list(prediction), int(np.argmax(prediction))))
+
+    def getStats(self):
+
+        stats = dict(self.stats)
+        stats["meanBatch"] = stats["requests"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    def close(self):
+
+        with self.condition:
+            self.running = False
+            for _, future in self.queue:
+                future.cancel()
+            self.queue = []
+            self.condition.notify_all()
+        self.thread.join()
+
+
+def measureBackend(modelPath, backend=None, numThreads=None, runs=50):
+
+    # Startup includes importing the runtime, so run this in a fresh process (see compareBackends)
+    t0 = time.perf_counter()
+    classifier = Classifier(modelPath, backend=backend, numThreads=numThreads)
+    startup = time.perf_counter() - t0
+
+    img = np.random.randint(0, 255, (480, 640, 3), np.uint8)
+    times = []
+    for _ in range(runs):
+        t = time.perf_counter()
+        classifier.getPrediction(img, draw=False)
+        times.append(time.perf_counter() - t)
+    times = np.array(times) * 1000
+    return {"model": modelPath, "backend": classifier.backendName, "startupS": round(startup, 3),
+            "p50Ms": round(float(np.percentile(times, 50)), 2), "p95Ms": round(float(np.percentile(times, 95)), 2)}
+
+
+def compareBackends(modelPaths, numThreads=None, runs=50):
+
+    results = []
+    for modelPath in modelPaths:
+        cmd = [sys.executable, "-m", "dejancv.ClassificationModule", "--measure", modelPath, str(numThreads or 0),
+               str(runs)]
+        out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+    for r in results:
+        print(f'{r["backend"]:7s} startup={r["startupS"]:6.2f}s p50={r["p50Ms"]:7.2f}ms p95={r["p95Ms"]:7.2f}ms'
+              f'  {r["model"]}')
+    return results
+
+
+def main():
     cap = cv2.VideoCapture(2)  # Initialize video capture
     path = "C:/Users/USER/Documents/maskModel/"
-    maskClassifier = Classifier(f'{path}/keras_model.h5', f'{path}/labels.txt')
+    # Reuse the last prediction while the scene changes less than 2 gray levels, refresh at least every second
+    maskClassifier = Classifier(f'{path}/keras_model.h5', f'{path}/labels.txt',
+                                gate=ChangeGate(threshold=2.0, maxAge=1.0))
 
     while True:
         _, img = cap.read()  # Capture frame-by-frame
         prediction = maskClassifier.getPrediction(img)
-        print(prediction)  # Print prediction result
+        print(prediction, maskClassifier.gate.getStats())  # Print prediction result and gate hit rate
         cv2.imshow("Image", img)
         cv2.waitKey(1)  # Wait for a key press
+
+
+def mainAsync():
+    cap = cv2.VideoCapture(2)  # Initialize video capture
+    path = "C:/Users/USER/Documents/maskModel/"
+    latest = {}
+
+    # The callback runs on the worker thread whenever a prediction is ready
+    def onPrediction(prediction, indexVal, frameId):
+        latest["indexVal"], latest["frameId"] = indexVal, frameId
+
+    maskClassifier = AsyncClassifier(Classifier(f'{path}/keras_model.h5', f'{path}/labels.txt'), onPrediction)
+
+    while True:
+        _, img = cap.read()  # Capture frame-by-frame
+
+        # Every frame is submitted, the worker always picks the newest one and drops the rest
+        maskClassifier.submit(img)
+
+        if latest:
+            putTextCached(img, maskClassifier.classifier.list_labels[latest["indexVal"]], (50, 50),
+                          cv2.FONT_HERSHEY_COMPLEX, 2, (0, 255, 0), 2)
+        print(maskClassifier.getStats())
+
+        cv2.imshow("Image", img)
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            break
+
+    maskClassifier.close()
+
+
+if __name__ == "__main__":
+    # python -m dejancv.ClassificationModule --compare model.h5 model.tflite model.onnx
+    if len(sys.argv) > 2 and sys.argv[1] == "--compare":
+        compareBackends(sys.argv[2:], numThreads=4)
+    elif len(sys.argv) > 2 and sys.argv[1] == "--measure":
+        print(json.dumps(measureBackend(sys.argv[2], numThreads=int(sys.argv[3]) or None, runs=int(sys.argv[4]))))
+    elif len(sys.argv) > 1 and sys.argv[1] == "--async":
+        mainAsync()
+    else:
+        main()
@@ -62,6 +62,96 @@ class ColorFinder:
         return imgColor, mask
 
 
+class ColorTracker:
+
+    def __init__(self, hsvVals, pyramidLevel=0, windowScale=4, minWindow=32, minArea=10, morphSize=3,
+                 maxMisses=5, smoothing=0.5):
+
+        self.lower = np.array([hsvVals['hmin'], hsvVals['smin'], hsvVals['vmin']], np.uint8)
+        self.upper = np.array([hsvVals['hmax'], hsvVals['smax'], hsvVals['vmax']], np.uint8)
+        self.pyramidLevel = pyramidLevel  # Threshold on the window shrunk by 2 ** pyramidLevel
+        self.windowScale = windowScale  # Search window size in blob radii
+        self.minWindow = minWindow  # Smallest half size of the search window, in full-frame pixels
+        self.minArea = minArea  # Blobs smaller than this (in full-frame pixels) count as lost
+        self.maxMisses = maxMisses  # Misses before searching the whole frame again
+        self.smoothing = smoothing  # Weight of the newest motion in the velocity estimate
+        self.kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (morphSize, morphSize)) if morphSize > 1 else None
+
+        self.center = None
+        self.velocity = np.zeros(2)
+        self.radius = minWindow / windowScale
+        self.misses = 0
+        self.window = None
+        self.buffers = None  # Full-frame sized scratch images, every step writes into a view of them
+
+    def reset(self):
+
+        self.center = None
+        self.velocity[:] = 0
+        self.misses = 0
+
+    def allocate(self, shape):
+
+        h, w = shape[:2]
+        f = 2 ** self.pyramidLevel
+        sh, sw = -(-h // f), -(-w // f)
+        self.buffers = {"shape": shape,
+                        "small": np.empty((sh, sw, 3), np.uint8),
+                        "hsv": np.empty((sh, sw, 3), np.uint8),
+                        "mask": np.empty((sh, sw), np.uint8),
+                        "clean": np.empty((sh, sw), np.uint8)}
+
+    def predictWindow(self, h, w):
+
+        # Around the predicted position, twice as large for every missed frame; the whole frame once lost
+        if self.center is None or self.misses > self.maxMisses:
+            return 0, 0, w, h
+        cx, cy = self.center + self.velocity
+        half = max(self.minWindow, self.windowScale * self.radius) * (2 ** self.misses)
+        x1, y1 = max(0, int(cx - half)), max(0, int(cy - half))
+        x2, y2 = min(w, int(cx + half)), min(h, int(cy + half))
+        if x2 - x1 < 2 or y2 - y1 < 2:
+            return 0, 0, w, h
+        return x1, y1, x2, y2
+
+    def update(self, img):
+
+        # Returns (found, (cx, cy), area) in full-frame pixels; self.window holds the searched region
+        h, w = img.shape[:2]
+        if self.buffers is None or self.buffers["shape"] != img.shape:
+            self.allocate(img.shape)
+        x1, y1, x2, y2 = self.window = self.predictWindow(h, w)
+        roi = img[y1:y2, x1:x2]
+
+        f = 2 ** self.pyramidLevel
+        if f > 1:
+            sw, sh = max(1, (x2 - x1) // f), max(1, (y2 - y1) // f)
+            roi = cv2.resize(roi, (sw, sh), dst=self.buffers["small"][:sh, :sw], interpolation=cv2.INTER_NEAREST)
+        sh, sw = roi.shape[:2]
+
+        hsv = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV, dst=self.buffers["hsv"][:sh, :sw])
+        mask = cv2.inRange(hsv, self.lower, self.upper, dst=self.buffers["mask"][:sh, :sw])
+        if self.kernel is not None:
+            mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, self.kernel, dst=self.buffers["clean"][:sh, :sw])
+
+        m = cv2.moments(mask, binaryImage=True)
+        area = m["m00"] * f * f
+        if area < self.minArea:
+            self.misses += 1
+            return False, None if self.center is None else tuple(self.center.astype(int)), 0
+
+        # Centroid of the window (scaled back from the pyramid level) in full-frame pixels
+        center = np.array([x1 + (m["m10"] / m["m00"] + 0.5) * f, y1 + (m["m01"] / m["m00"] + 0.5) * f])
+        if self.center is not None and self.misses == 0:
+            self.velocity += self.smoothing * ((center - self.center) - self.velocity)
+        else:
+            self.velocity[:] = 0
+        self.center = center
+        self.radius = np.sqrt(area / np.pi)
+        self.misses = 0
+        return True, tuple(center.astype(int)), area
+
+
 if __name__ == "__main__":
     # Create an instance of the ColorFinder class with trackBar set to True.
     myColorFinder = ColorFinder(trackBar=True)
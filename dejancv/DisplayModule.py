@@ -0,0 +1,127 @@
+import queue
+import threading
+import time
+
+import cv2
+
+from dejancv import DrawModule
+
+
+class DisplaySink:
+
+    def __init__(self, maxFps=30, enabled=None):
+
+        # enabled=None follows the draw mode: nothing is shown (and no thread is started) while headless
+        self.maxFps = maxFps  # Windows are refreshed at most this often, however fast frames arrive
+        self.enabled = DrawModule.isEnabled() if enabled is None else enabled
+        self.frames = {}  # Window name -> latest frame not shown yet
+        self.condition = threading.Condition()
+        self.keys = queue.Queue()
+        self.running = self.enabled
+        self.stats = {"submitted": 0, "shown": 0, "skipped": 0, "refreshes": 0}
+        self.thread = None
+        if self.enabled:
+            self.thread = threading.Thread(target=self.worker, daemon=True)
+            self.thread.start()
+
+    def show(self, winName, img, copy=False):
+
+        # Never blocks. A frame not shown before the next one for the same window arrives is skipped.
+        # Pass copy=True if img will be modified after this call.
+        if not self.enabled:
+            return
+        with self.condition:
+            self.stats["submitted"] += 1
+            if winName in self.frames:
+                self.stats["skipped"] += 1
+            self.frames[winName] = img.copy() if copy else img
+            self.condition.notify()
+
+    def getKey(self, timeout=None):
+
+        # Next key pressed in any window, None if there is none (waits up to timeout seconds when given)
+        try:
+            return self.keys.get(timeout=timeout) if timeout else self.keys.get_nowait()
+        except queue.Empty:
+            return None
+
+    def worker(self):
+
+        # All GUI calls happen on this thread. Some platforms (macOS) only allow HighGUI on the main thread,
+        # use enabled=False there and call imshow from the main loop instead.
+        interval = 1 / self.maxFps
+        nextRefresh = time.perf_counter()
+        while True:
+            with self.condition:
+                # Wake up for new frames, or at the refresh interval so the windows keep handling events
+                self.condition.wait_for(lambda: self.frames or not self.running, timeout=interval)
+                if not self.running:
+                    break
+                frames, self.frames = self.frames, {}
+
+            for winName, img in frames.items():
+                cv2.imshow(winName, img)
+
+            key = cv2.waitKey(1)
+            if key != -1:
+                self.keys.put(key & 0xFF)
+            with self.condition:
+                self.stats["shown"] += len(frames)
+                self.stats["refreshes"] += 1
+
+            # Cap the refresh rate: frames arriving meanwhile replace each other
+            nextRefresh += interval
+            delay = nextRefresh - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                nextRefresh = time.perf_counter()
+
+        cv2.destroyAllWindows()
+
+    def getStats(self):
+
+        with self.condition:
+            return dict(self.stats)
+
+    def close(self):
+
+        if self.thread is not None:
+            with self.condition:
+                self.running = False
+                self.condition.notify()
+            self.thread.join()
+            self.thread = None
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *exc):
+
+        self.close()
+
+
+def main():
+    from dejancv.HandTrackingModule import HandDetector
+    from dejancv.Utils import stackImages
+
+    cap = cv2.VideoCapture(0)
+    detector = HandDetector(maxHands=2)
+
+    # Processing runs as fast as detection allows, the windows refresh at 20 FPS on their own thread
+    with DisplaySink(maxFps=20) as display:
+        while True:
+            success, img = cap.read()
+            imgRaw = img.copy()
+            hands, img = detector.findHands(img, draw=True)
+
+            display.show("Stack", stackImages([imgRaw, img], 2, 1))
+            if display.getKey() == ord('q'):
+                break
+
+        print(display.getStats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+import hashlib
+import http.client
+import json
+import os
+import tempfile
+import threading
+import urllib.error
+import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+
+class ImageFetcher:
+
+    def __init__(self, cacheDir=None, memorySize=128, maxWorkers=8, timeout=10, revalidate=True):
+
+        self.cacheDir = cacheDir  # Folder for the on-disk cache, None disables it
+        self.memorySize = memorySize  # Decoded images kept in memory (LRU)
+        self.maxWorkers = maxWorkers  # Concurrent downloads (and open connections per host) in fetchMany
+        self.timeout = timeout
+        self.revalidate = revalidate  # Ask the server (ETag/Last-Modified) before using a disk-cached file
+
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.local = threading.local()  # Keep-alive connections, one set per thread
+        self.connections = []  # Every open connection of every thread, so close() reaches the pool workers' too
+        self.generation = 0  # Bumped by dropConnections, threads then start over with new connections
+        self.pool = None
+        self.stats = {"memoryHits": 0, "diskHits": 0, "notModified": 0, "downloads": 0, "reconnects": 0}
+
+        if self.cacheDir:
+            os.makedirs(self.cacheDir, exist_ok=True)
+
+    # ---- Connections ---- #
+
+    def getConnection(self, scheme, netloc):
+
+        if getattr(self.local, "generation", None) != self.generation:
+            self.local.connections = {}
+            self.local.generation = self.generation
+        connections = self.local.connections
+        conn = connections.get((scheme, netloc))
+        if conn is None:
+            connClass = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            conn = connections[(scheme, netloc)] = connClass(netloc, timeout=self.timeout)
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    def dropConnection(self, scheme, netloc):
+
+        conn = getattr(self.local, "connections", {}).pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+            with self.lock:
+                if conn in self.connections:
+                    self.connections.remove(conn)
+
+    def request(self, url, headers, maxRedirects=5):
+
+        for _ in range(maxRedirects + 1):
+            parts = urllib.parse.urlsplit(url)
+            path = parts.path or "/"
+            if parts.query:
+                path += "?" + parts.query
+
+            # A kept-alive connection may have been closed by the server, reconnect once
+            for attempt in range(2):
+                conn = self.getConnection(parts.scheme, parts.netloc)
+                try:
+                    conn.request("GET", path, headers=headers)
+                    response = conn.getresponse()
+                    body = self.readBody(response)
+                    break
+                except (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                        ConnectionResetError, BrokenPipeError):
+                    self.dropConnection(parts.scheme, parts.netloc)
+                    self.count("reconnects")
+                    if attempt == 1:
+                        raise
+
+            if response.will_close:
+                self.dropConnection(parts.scheme, parts.netloc)
+
+            if response.status in (301, 302, 303, 307, 308) and response.getheader("Location"):
+                url = urllib.parse.urljoin(url, response.getheader("Location"))
+                continue
+            return url, response, body
+
+        raise IOError(f"Too many redirects, last location {url}")
+
+    @staticmethod
+    def readBody(response):
+
+        # Read straight into one preallocated buffer when the size is known, so decoding needs no copy
+        length = response.getheader("Content-Length")
+        if length is None or int(length) == 0:
+            # read() also finishes empty responses (e.g. redirects), so the connection can send the next request
+            return response.read()
+        body = bytearray(int(length))
+        view = memoryview(body)
+        pos = 0
+        while pos < len(body):
+            n = response.readinto(view[pos:])
+            if n == 0:
+                raise http.client.IncompleteRead(bytes(body[:pos]), len(body) - pos)
+            pos += n
+        return body
+
+    def count(self, name):
+
+        with self.lock:
+            self.stats[name] += 1
+
+    # ---- Caches ---- #
+
+    def cachePaths(self, url):
+
+        name = hashlib.sha1(url.encode()).hexdigest()
+        return os.path.join(self.cacheDir, name), os.path.join(self.cacheDir, name + ".json")
+
+    def readDisk(self, url):
+
+        if not self.cacheDir:
+            return None, {}
+        bodyPath, metaPath = self.cachePaths(url)
+        if not os.path.exists(bodyPath) or not os.path.exists(metaPath):
+            return None, {}
+        with open(metaPath) as f:
+            meta = json.load(f)
+        with open(bodyPath, "rb") as f:
+            return f.read(), meta
+
+    def writeDisk(self, url, body, response):
+
+        if not self.cacheDir:
+            return
+        bodyPath, metaPath = self.cachePaths(url)
+        meta = {"url": url, "etag": response.getheader("ETag"), "lastModified": response.getheader("Last-Modified")}
+
+        # Write to unique temporary files first so a crash never leaves a half written entry, even with
+        # several threads or processes sharing the cache folder
+        with tempfile.NamedTemporaryFile("wb", dir=self.cacheDir, suffix=".tmp", delete=False) as f:
+            f.write(body)
+        bodyTmp = f.name
+        with tempfile.NamedTemporaryFile("w", dir=self.cacheDir, suffix=".tmp", delete=False) as f:
+            json.dump(meta, f)
+        os.replace(bodyTmp, bodyPath)
+        os.replace(f.name, metaPath)
+
+    def remember(self, key, image):
+
+        with self.lock:
+            self.memory[key] = image
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memorySize:
+                self.memory.popitem(last=False)
+
+    # ---- Fetching ---- #
+
+    @staticmethod
+    def decode(body, keepTransparency=False):
+
+        # np.frombuffer wraps the downloaded bytes without copying them
+        data = np.frombuffer(body, dtype=np.uint8)
+        return cv2.imdecode(data, cv2.IMREAD_UNCHANGED if keepTransparency else cv2.IMREAD_COLOR)
+
+    def fetchBytes(self, url):
+
+        cached, meta = self.readDisk(url)
+        if cached is not None and not self.revalidate:
+            self.count("diskHits")
+            return cached
+
+        headers = {"Connection": "keep-alive"}
+        if cached is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("lastModified"):
+                headers["If-Modified-Since"] = meta["lastModified"]
+
+        finalUrl, response, body = self.request(url, headers)
+        if response.status == 304 and cached is not None:
+            self.count("notModified")
+            return cached
+        if response.status != 200:
+            raise urllib.error.HTTPError(finalUrl, response.status, response.reason, response.headers, None)
+
+        self.count("downloads")
+        self.writeDisk(url, body, response)
+        return body
+
+    def fetch(self, url, keepTransparency=False, copy=True):
+
+        # Images in memory are shared between calls, the default copy keeps callers from changing the cache
+        key = (url, keepTransparency)
+        with self.lock:
+            image = self.memory.get(key)
+            if image is not None:
+                self.memory.move_to_end(key)
+                self.stats["memoryHits"] += 1
+        if image is None:
+            image = self.decode(self.fetchBytes(url), keepTransparency)
+            if image is None:
+                raise ValueError(f"Could not decode image from {url}")
+            self.remember(key, image)
+        return image.copy() if copy else image
+
+    def fetchMany(self, urls, keepTransparency=False, copy=True):
+
+        # Downloads run concurrently, each worker thread reuses its own keep-alive connections
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(self.maxWorkers)
+        return list(self.pool.map(lambda url: self.fetch(url, keepTransparency, copy), urls))
+
+    def close(self):
+
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        self.dropConnections()
+
+    def dropConnections(self):
+
+        with self.lock:
+            connections, self.connections = self.connections, []
+            self.generation += 1
+        for conn in connections:
+            conn.close()
+
+
+# Shared by the whole process, used by Utils.downloadImageFromUrl. Only connections are kept by default;
+# give it a cacheDir for ETag/Last-Modified revalidation across runs.
+fetcher = ImageFetcher(memorySize=0)
+
+
+def main():
+    import functools
+    import time
+    from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+    # Stand-in for the asset mirror: a local HTTP/1.1 server serving generated PNGs
+    assetDir = tempfile.mkdtemp()
+    for i in range(200):
+        img = np.zeros((64, 64, 4), np.uint8)
+        cv2.circle(img, (32, 32), 20 + i % 10, (255, 0, 255, 255), cv2.FILLED)
+        cv2.imwrite(os.path.join(assetDir, f"overlay{i}.png"), img)
+
+    class QuietHandler(SimpleHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+    handler = functools.partial(QuietHandler, directory=assetDir)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    urls = [f"http://127.0.0.1:{server.server_port}/overlay{i}.png" for i in range(200)]
+
+    fetcher = ImageFetcher(cacheDir=tempfile.mkdtemp(), memorySize=256, maxWorkers=8)
+
+    # Cold start: everything is downloaded and written to the disk cache
+    t = time.perf_counter()
+    images = fetcher.fetchMany(urls, keepTransparency=True)
+    print(f"cold: {time.perf_counter() - t:.3f}s {images[0].shape}")
+
+    # Same process again: served from memory
+    t = time.perf_counter()
+    fetcher.fetchMany(urls, keepTransparency=True)
+    print(f"memory: {time.perf_counter() - t:.3f}s")
+
+    # New process with the same cache folder: revalidated with If-Modified-Since, answered with 304
+    fetcher2 = ImageFetcher(cacheDir=fetcher.cacheDir)
+    t = time.perf_counter()
+    fetcher2.fetchMany(urls, keepTransparency=True)
+    print(f"revalidated: {time.perf_counter() - t:.3f}s")
+
+    print(fetcher.stats, fetcher2.stats)
+    fetcher.close()
+    fetcher2.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
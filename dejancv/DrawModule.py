@@ -0,0 +1,182 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from dejancv import MetricsModule
+
+# Drawing modes, shared by the whole package
+IMMEDIATE = "immediate"  # Draw straight into the frame (default, same as plain cv2 calls)
+HEADLESS = "headless"  # Every annotation is a no-op
+DEFERRED = "deferred"  # Record annotations into a draw list and render them later, once
+
+_mode = IMMEDIATE
+_local = threading.local()
+
+
+class DrawList:
+
+    def __init__(self):
+
+        self.items = []
+
+    def __len__(self):
+
+        return len(self.items)
+
+    def add(self, fn, args, kwargs):
+
+        self.items.append((fn, args, kwargs))
+
+    def clear(self):
+
+        self.items.clear()
+
+    def render(self, img, clear=True):
+
+        # Replay every recorded primitive onto img, in the order they were recorded
+        for fn, args, kwargs in self.items:
+            fn(img, *args, **kwargs)
+        if clear:
+            self.clear()
+        return img
+
+    def renderOverlay(self, shape, clear=True):
+
+        # Render onto a blank layer so the analyzed frame stays untouched.
+        # The mask marks every pixel an annotation touched (annotations drawn in pure black are not masked).
+        overlay = np.zeros((shape[0], shape[1], 3), np.uint8)
+        self.render(overlay, clear)
+        mask = cv2.cvtColor(overlay, cv2.COLOR_BGR2GRAY) > 0
+        return overlay, mask
+
+
+def setMode(mode):
+
+    global _mode
+    if mode not in (IMMEDIATE, HEADLESS, DEFERRED):
+        raise ValueError(f"Unknown draw mode '{mode}', use '{IMMEDIATE}', '{HEADLESS}' or '{DEFERRED}'")
+    _mode = mode
+
+
+def getMode():
+
+    return _mode
+
+
+def setHeadless(enabled=True):
+
+    setMode(HEADLESS if enabled else IMMEDIATE)
+
+
+def setDeferred(enabled=True):
+
+    setMode(DEFERRED if enabled else IMMEDIATE)
+
+
+def isEnabled():
+
+    # Detectors check this before building any annotation, so headless mode costs nothing
+    return _mode != HEADLESS
+
+
+def getDrawList():
+
+    # One draw list per thread, so parallel pipelines don't mix their annotations
+    drawList = getattr(_local, "drawList", None)
+    if drawList is None:
+        drawList = _local.drawList = DrawList()
+    return drawList
+
+
+def takeDrawList():
+
+    # Hand the recorded primitives over (e.g. to another thread) and start a fresh list
+    drawList = getDrawList()
+    _local.drawList = DrawList()
+    return drawList
+
+
+def render(img, drawList=None, clear=True):
+
+    drawList = getDrawList() if drawList is None else drawList
+    return drawList.render(img, clear)
+
+
+def renderOverlay(shape, drawList=None, clear=True):
+
+    drawList = getDrawList() if drawList is None else drawList
+    return drawList.renderOverlay(shape, clear)
+
+
+def call(fn, img, *args, **kwargs):
+
+    # Run a drawing function according to the current mode. Always returns img, like the cv2 drawing calls.
+    if _mode == IMMEDIATE:
+        if MetricsModule.isEnabled():
+            start = time.perf_counter()
+            fn(img, *args, **kwargs)
+            MetricsModule.addDrawTime(time.perf_counter() - start)
+        else:
+            fn(img, *args, **kwargs)
+    elif _mode == DEFERRED:
+        getDrawList().add(fn, args, kwargs)
+    return img
+
+
+def line(img, *args, **kwargs):
+
+    return call(cv2.line, img, *args, **kwargs)
+
+
+def circle(img, *args, **kwargs):
+
+    return call(cv2.circle, img, *args, **kwargs)
+
+
+def rectangle(img, *args, **kwargs):
+
+    return call(cv2.rectangle, img, *args, **kwargs)
+
+
+def putText(img, *args, **kwargs):
+
+    return call(cv2.putText, img, *args, **kwargs)
+
+
+def drawLandmarks(img, *args, **kwargs):
+
+    # MediaPipe is only imported when landmarks are actually drawn
+    if _mode == HEADLESS:
+        return img
+    import mediapipe as mp
+    return call(mp.solutions.drawing_utils.draw_landmarks, img, *args, **kwargs)
+
+
+def main():
+    from dejancv.HandTrackingModule import HandDetector
+
+    cap = cv2.VideoCapture(0)
+    detector = HandDetector(maxHands=2)
+
+    # Record annotations instead of drawing them into the frame we analyze
+    setDeferred()
+
+    while True:
+        success, img = cap.read()
+
+        # Drawing calls inside findHands are recorded, img stays clean for further analysis
+        hands, img = detector.findHands(img, draw=True)
+
+        # Render everything once, onto a separate overlay, only because we display the video
+        overlay, mask = renderOverlay(img.shape)
+        imgShow = img.copy()
+        imgShow[mask] = overlay[mask]
+
+        cv2.imshow("Image", imgShow)
+        cv2.waitKey(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 import time
 import cv2
-import cvzone
+
+from dejancv.Utils import putTextRect
 
 class FPS:
 
@@ -27,9 +28,9 @@ class FPS:
 
         # Draw FPS on image if img is provided
         if img is not None:
-            cvzone.putTextRect(img, f'FPS: {int(fps)}', pos,
-                               scale=scale, thickness=thickness, colorT=textColor,
-                               colorR=bgColor, offset=10)
+            putTextRect(img, f'FPS: {int(fps)}', pos,
+                        scale=scale, thickness=thickness, colorT=textColor,
+                        colorR=bgColor, offset=10)
         return fps, img
 
 
@@ -1,8 +1,17 @@
 
+import queue
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
 import mediapipe as mp
+import numpy as np
 
 import cvzone
+from dejancv import DrawModule, MetricsModule
+from dejancv.TrackerModule import nms
+from dejancv.Utils import putTextCached
 
 
 class FaceDetector:
@@ -18,8 +27,11 @@ class FaceDetector:
 
     def findFaces(self, img, draw=True):
 
+        timer = MetricsModule.timer("FaceDetector.findFaces")
         imgRGB = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        timer.lap("convert")
         self.results = self.faceDetection.process(imgRGB)
+        timer.lap("inference")
         bboxs = []
         if self.results.detections:
             for id, detection in enumerate(self.results.detections):
@@ -32,14 +44,122 @@ class FaceDetector:
                              bbox[1] + (bbox[3] // 2)
                     bboxInfo = {"id": id, "bbox": bbox, "score": detection.score, "center": (cx, cy)}
                     bboxs.append(bboxInfo)
-                    if draw:
-                        img = cv2.rectangle(img, bbox, (255, 0, 255), 2)
+                    if draw and DrawModule.isEnabled():
+                        img = DrawModule.rectangle(img, bbox, (255, 0, 255), 2)
+
+                        putTextCached(img, f'{int(detection.score[0] * 100)}%',
+                                      (bbox[0], bbox[1] - 20), cv2.FONT_HERSHEY_PLAIN,
+                                      2, (255, 0, 255), 2)
+        timer.end("postprocess")
+        return img, bboxs
+
+
+class TiledFaceDetector:
+
+    def __init__(self, tileSize=640, overlap=0.25, workers=4, minDetectionCon=0.5, modelSelection=0,
+                 nmsThreshold=0.3, fullFrame=True):
+
+        self.tileSize = tileSize  # Side of the square tiles in pixels
+        self.overlap = overlap  # Fraction of a tile shared with its neighbours, so faces on a seam are seen whole
+        self.nmsThreshold = nmsThreshold  # IoU above which duplicates from neighbouring tiles are merged
+        self.fullFrame = fullFrame  # Also run on the whole frame, for faces bigger than a tile
+        self.minDetectionCon = minDetectionCon
+
+        # MediaPipe graphs are not thread safe, so every worker checks out its own detector
+        self.detectors = queue.Queue()
+        for _ in range(workers):
+            self.detectors.put(FaceDetector(minDetectionCon=minDetectionCon, modelSelection=modelSelection))
+        self.pool = ThreadPoolExecutor(workers)
+
+    def getTiles(self, h, w):
+
+        t = self.tileSize
+        stride = max(1, int(t * (1 - self.overlap)))
+        xs = list(range(0, max(w - t, 0) + 1, stride))
+        ys = list(range(0, max(h - t, 0) + 1, stride))
+        # Make sure the right and bottom edges are covered
+        if xs[-1] + t < w:
+            xs.append(w - t)
+        if ys[-1] + t < h:
+            ys.append(h - t)
+        tiles = [(x, y, min(t, w - x), min(t, h - y)) for y in ys for x in xs]
+        if self.fullFrame and len(tiles) > 1:
+            tiles.append((0, 0, w, h))
+        return tiles
+
+    def detectTile(self, img, tile):
+
+        x, y, w, h = tile
+        detector = self.detectors.get()
+        try:
+            _, bboxs = detector.findFaces(img[y:y + h, x:x + w], draw=False)
+        finally:
+            self.detectors.put(detector)
+
+        # Back to frame coordinates
+        for bboxInfo in bboxs:
+            bx, by, bw, bh = bboxInfo["bbox"]
+            bboxInfo["bbox"] = (bx + x, by + y, bw, bh)
+            bboxInfo["center"] = (bboxInfo["center"][0] + x, bboxInfo["center"][1] + y)
+        return bboxs
+
+    def findFaces(self, img, draw=True):
 
-                        cv2.putText(img, f'{int(detection.score[0] * 100)}%',
-                                    (bbox[0], bbox[1] - 20), cv2.FONT_HERSHEY_PLAIN,
-                                    2, (255, 0, 255), 2)
+        timer = MetricsModule.timer("TiledFaceDetector.findFaces")
+        h, w = img.shape[:2]
+        results = self.pool.map(lambda tile: self.detectTile(img, tile), self.getTiles(h, w))
+        candidates = [bboxInfo for bboxs in results for bboxInfo in bboxs]
+        timer.lap("inference")
+
+        # Faces seen by more than one tile are merged, the most confident box wins
+        bboxs = []
+        if candidates:
+            keep = nms([c["bbox"] for c in candidates], [c["score"][0] for c in candidates], self.nmsThreshold)
+            bboxs = [candidates[i] for i in keep]
+
+        for id, bboxInfo in enumerate(bboxs):
+            bboxInfo["id"] = id
+            if draw and DrawModule.isEnabled():
+                bbox = bboxInfo["bbox"]
+                DrawModule.rectangle(img, bbox, (255, 0, 255), 2)
+                putTextCached(img, f'{int(bboxInfo["score"][0] * 100)}%',
+                              (bbox[0], bbox[1] - 20), cv2.FONT_HERSHEY_PLAIN,
+                              2, (255, 0, 255), 2)
+        timer.end("postprocess")
         return img, bboxs
 
+    def close(self):
+
+        self.pool.shutdown()
+        while not self.detectors.empty():
+            self.detectors.get().faceDetection.close()
+
+
+def benchmarkTiling(source, tileSizes=(None, 1280, 960, 640), numFrames=100):
+
+    # Faces found per frame (a recall proxy on a crowded video) against latency, for each tile size.
+    # None is the plain full-frame FaceDetector.
+    for tileSize in tileSizes:
+        if tileSize is None:
+            detector = FaceDetector()
+        else:
+            detector = TiledFaceDetector(tileSize=tileSize)
+        cap = cv2.VideoCapture(source)
+        faces, times = [], []
+        for _ in range(numFrames):
+            success, img = cap.read()
+            if not success:
+                break
+            t = time.perf_counter()
+            _, bboxs = detector.findFaces(img, draw=False)
+            times.append(time.perf_counter() - t)
+            faces.append(len(bboxs))
+        cap.release()
+        if isinstance(detector, TiledFaceDetector):
+            detector.close()
+        print(f'tileSize={str(tileSize or "full"):5s} faces/frame={np.mean(faces):6.2f} '
+              f'mean={np.mean(times) * 1000:7.1f}ms p95={np.percentile(times, 95) * 1000:7.1f}ms')
+
 
 def main():
     # Initialize the webcam
@@ -86,4 +206,8 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    # python -m dejancv.FaceDetectionModule --benchmark lobby4k.mp4
+    if len(sys.argv) > 2 and sys.argv[1] == "--benchmark":
+        benchmarkTiling(sys.argv[2])
+    else:
+        main()
@@ -0,0 +1,197 @@
+import cv2
+import numpy as np
+
+# Landmark index groups of the 468 point face mesh. Left and right are the subject's, so the right eye
+# appears on the left of an unflipped frame. Eyes are (outer, top1, top2, inner, bottom2, bottom1)
+# in the order of the eye aspect ratio formula.
+FACE_GROUPS = {
+    "rightEye": (33, 160, 158, 133, 153, 144),
+    "leftEye": (263, 387, 385, 362, 380, 373),
+    "mouth": (78, 13, 308, 14),  # Inner lip corners and inner lip centers: (corner, top, corner, bottom)
+    "pose": (1, 152, 33, 263, 61, 291),  # Nose tip, chin, outer eye corners, mouth corners
+}
+
+# Generic adult face in millimetres for the "pose" group (outer eye corners 90 mm apart), in camera axes
+# (x right, y down, z away from the camera), so a face looking straight into the camera has zero rotation.
+# With it the translation from headPose is in millimetres too, as exact as the focal length is.
+FACE_MODEL_3D = np.array([
+    (0.0, 0.0, 0.0),  # Nose tip
+    (0.0, 66.0, 13.0),  # Chin
+    (-45.0, -34.0, 27.0),  # Right eye outer corner (image left)
+    (45.0, -34.0, 27.0),  # Left eye outer corner (image right)
+    (-30.0, 30.0, 25.0),  # Right mouth corner
+    (30.0, 30.0, 25.0),  # Left mouth corner
+], dtype=np.float64)
+
+
+def toArray(faces):
+
+    # faces from FaceMeshDetector.findFaceMesh (a list of 468 [x, y] points per face) as a (faces, 468, 2) array
+    if len(faces) == 0:
+        return np.empty((0, 468, 2), np.float32)
+    return np.asarray(faces, dtype=np.float32)
+
+
+def _dist(p, q):
+
+    d = p[..., :2] - q[..., :2]
+    return np.hypot(d[..., 0], d[..., 1])
+
+
+def eyeAspectRatio(landmarks, eye=FACE_GROUPS["rightEye"]):
+
+    # landmarks: (..., 468, 2|3), e.g. (faces, 468, 2) or (frames, faces, 468, 3). Returns (...).
+    # Around 0.3 for an open eye and close to 0 for a closed one, independent of the face size.
+    lm = np.asarray(landmarks, dtype=np.float32)
+    p = lm[..., list(eye), :]
+    vertical = _dist(p[..., 1, :], p[..., 5, :]) + _dist(p[..., 2, :], p[..., 4, :])
+    horizontal = _dist(p[..., 0, :], p[..., 3, :])
+    return vertical / np.maximum(2 * horizontal, 1e-6)
+
+
+def mouthOpening(landmarks, mouth=FACE_GROUPS["mouth"]):
+
+    # Inner lip gap divided by the mouth width, (..., 468, 2|3) -> (...). 0 when closed, about 0.5 for a wide yawn.
+    lm = np.asarray(landmarks, dtype=np.float32)
+    p = lm[..., list(mouth), :]
+    return _dist(p[..., 1, :], p[..., 3, :]) / np.maximum(_dist(p[..., 0, :], p[..., 2, :]), 1e-6)
+
+
+def cameraMatrix(imgSize, focal=None):
+
+    # Approximate pinhole camera for an uncalibrated webcam: focal length about the image width, center in the middle
+    w, h = imgSize
+    focal = w if focal is None else focal
+    return np.array([[focal, 0, w / 2], [0, focal, h / 2], [0, 0, 1]], dtype=np.float64)
+
+
+def rotationToEuler(rotations):
+
+    # (..., 3, 3) rotation matrices -> (..., 3) pitch, yaw, roll in degrees (x, y, z axes of the camera)
+    r = np.asarray(rotations, dtype=np.float64)
+    pitch = np.arctan2(r[..., 2, 1], r[..., 2, 2])
+    yaw = np.arctan2(-r[..., 2, 0], np.hypot(r[..., 2, 1], r[..., 2, 2]))
+    roll = np.arctan2(r[..., 1, 0], r[..., 0, 0])
+    return np.degrees(np.stack([pitch, yaw, roll], axis=-1))
+
+
+def headPose(landmarks, camera, previous=None):
+
+    # landmarks: (faces, 468, 2|3) in pixels. Returns (angles (faces, 3) pitch/yaw/roll in degrees, rvecs, tvecs).
+    # solvePnP has no batched form, so it runs once per face on the six "pose" points; the gathering
+    # before and the angle conversion after are done for all faces at once.
+    lm = np.asarray(landmarks, dtype=np.float64)
+    lead = lm.shape[:-2]
+    points = np.ascontiguousarray(lm[..., list(FACE_GROUPS["pose"]), :2].reshape(-1, len(FACE_GROUPS["pose"]), 2))
+    rvecs = np.zeros((len(points), 3), np.float64)
+    tvecs = np.zeros((len(points), 3), np.float64)
+    rotations = np.empty((len(points), 3, 3), np.float64)
+
+    for i, imagePoints in enumerate(points):
+        if previous is not None and i < len(previous[0]):
+            # Start from last frame's solution, fewer iterations for a face that barely moved
+            rvec, tvec = previous[0][i].reshape(3, 1).copy(), previous[1][i].reshape(3, 1).copy()
+            _, rvec, tvec = cv2.solvePnP(FACE_MODEL_3D, imagePoints, camera, None, rvec, tvec,
+                                         useExtrinsicGuess=True, flags=cv2.SOLVEPNP_ITERATIVE)
+        else:
+            _, rvec, tvec = cv2.solvePnP(FACE_MODEL_3D, imagePoints, camera, None, flags=cv2.SOLVEPNP_ITERATIVE)
+        rvecs[i], tvecs[i] = rvec.ravel(), tvec.ravel()
+        rotations[i] = cv2.Rodrigues(rvec)[0]
+
+    angles = rotationToEuler(rotations)
+    return angles.reshape(lead + (3,)), rvecs.reshape(lead + (3,)), tvecs.reshape(lead + (3,))
+
+
+def countBlinks(ear, threshold=0.2, minFrames=2):
+
+    # ear: (frames,) or (frames, faces) eye aspect ratios from a stored sequence.
+    # A blink is a run of at least minFrames frames below the threshold. Returns the count per column.
+    closed = np.asarray(ear) < threshold
+    squeeze = closed.ndim == 1
+    closed = closed.reshape(len(closed), -1)
+    padded = np.pad(closed, ((1, 1), (0, 0))).astype(np.int8)
+    edges = np.diff(padded, axis=0)
+
+    counts = np.zeros(closed.shape[1], dtype=np.intp)
+    for col in range(closed.shape[1]):
+        starts = np.flatnonzero(edges[:, col] == 1)
+        ends = np.flatnonzero(edges[:, col] == -1)
+        counts[col] = np.count_nonzero(ends - starts >= minFrames)
+    return int(counts[0]) if squeeze else counts
+
+
+class FaceFeatureExtractor:
+
+    def __init__(self, imgSize=None, focal=None, withPose=True):
+
+        self.focal = focal
+        self.withPose = withPose  # Head pose is the only per-face loop, turn it off when only eyes and mouth matter
+        self.camera = None if imgSize is None else cameraMatrix(imgSize, focal)
+        self.previous = None  # Last frame's rvecs/tvecs, used as the starting point of the next solve
+
+    def extract(self, faces, imgSize=None):
+
+        # faces: (faces, 468, 2|3) array or the list from findFaceMesh. Returns a dict of per-face arrays.
+        lm = faces if isinstance(faces, np.ndarray) else toArray(faces)
+        features = {
+            "leftEAR": eyeAspectRatio(lm, FACE_GROUPS["leftEye"]),
+            "rightEAR": eyeAspectRatio(lm, FACE_GROUPS["rightEye"]),
+            "mouth": mouthOpening(lm),
+        }
+        features["ear"] = (features["leftEAR"] + features["rightEAR"]) / 2
+
+        if self.withPose:
+            if imgSize is not None and (self.camera is None or
+                                        (self.camera[0, 2] * 2, self.camera[1, 2] * 2) != tuple(imgSize)):
+                self.camera = cameraMatrix(imgSize, self.focal)
+            if self.camera is None:
+                raise ValueError("Head pose needs the image size, pass imgSize=(width, height)")
+            # Reusing last frame's solution only makes sense while the number of faces stays the same
+            previous = self.previous if self.previous is not None and len(self.previous[0]) == len(lm) else None
+            angles, rvecs, tvecs = headPose(lm, self.camera, previous)
+            self.previous = (rvecs, tvecs)
+            features["pitch"], features["yaw"], features["roll"] = angles[:, 0], angles[:, 1], angles[:, 2]
+            features["rvec"], features["tvec"] = rvecs, tvecs
+        return features
+
+    def reset(self):
+
+        self.previous = None
+
+
+def main():
+    import time
+    from dejancv.FaceMeshModule import FaceMeshDetector
+
+    cap = cv2.VideoCapture(0)
+    detector = FaceMeshDetector(maxFaces=4)
+    extractor = FaceFeatureExtractor()
+    history = []
+
+    while True:
+        success, img = cap.read()
+        img, faces = detector.findFaceMesh(img, draw=False)
+
+        if faces:
+            t = time.perf_counter()
+            features = extractor.extract(faces, imgSize=(img.shape[1], img.shape[0]))
+            took = (time.perf_counter() - t) * 1000 / len(faces)
+            history.append(features["ear"][0])
+
+            for i, face in enumerate(faces):
+                x, y = face[10]
+                cv2.putText(img, f'EAR {features["ear"][i]:.2f} mouth {features["mouth"][i]:.2f}',
+                            (x - 150, y - 60), cv2.FONT_HERSHEY_PLAIN, 1.5, (255, 0, 255), 2)
+                cv2.putText(img, f'pitch {features["pitch"][i]:.0f} yaw {features["yaw"][i]:.0f} '
+                                 f'roll {features["roll"][i]:.0f}',
+                            (x - 150, y - 35), cv2.FONT_HERSHEY_PLAIN, 1.5, (255, 0, 255), 2)
+            cv2.putText(img, f"{took:.3f} ms/face  blinks {countBlinks(np.array(history))}", (20, 40),
+                        cv2.FONT_HERSHEY_PLAIN, 2, (0, 255, 0), 2)
+
+        cv2.imshow("Image", img)
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            break
+
+
+if __name__ == "__main__":
+    main()
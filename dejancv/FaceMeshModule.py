@@ -1,17 +1,21 @@
 
 import cv2
 import mediapipe as mp
-import math
+import numpy as np
+
+from dejancv import DrawModule, GeometryModule, MetricsModule
+from dejancv.Utils import prepareInput
 
 
 class FaceMeshDetector:
 
-    def __init__(self, staticMode=False, maxFaces=2, minDetectionCon=0.5, minTrackCon=0.5):
+    def __init__(self, staticMode=False, maxFaces=2, minDetectionCon=0.5, minTrackCon=0.5, processScale=1):
 
         self.staticMode = staticMode
         self.maxFaces = maxFaces
         self.minDetectionCon = minDetectionCon
         self.minTrackCon = minTrackCon
+        self.processScale = processScale  # Run the model on a copy resized by this factor, results are in full-frame pixels
 
         self.mpDraw = mp.solutions.drawing_utils
         self.mpFaceMesh = mp.solutions.face_mesh
@@ -23,36 +27,55 @@ class FaceMeshDetector:
 
     def findFaceMesh(self, img, draw=True):
 
-        self.imgRGB = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        timer = MetricsModule.timer("FaceMeshDetector.findFaceMesh")
+        self.imgRGB = prepareInput(img, self.processScale)
+        timer.lap("convert")
         self.results = self.faceMesh.process(self.imgRGB)
+        timer.lap("inference")
         faces = []
         if self.results.multi_face_landmarks:
             for faceLms in self.results.multi_face_landmarks:
                 if draw:
-                    self.mpDraw.draw_landmarks(img, faceLms, self.mpFaceMesh.FACEMESH_CONTOURS,
-                                               self.drawSpec, self.drawSpec)
+                    DrawModule.drawLandmarks(img, faceLms, self.mpFaceMesh.FACEMESH_CONTOURS,
+                                             self.drawSpec, self.drawSpec)
                 face = []
                 for id, lm in enumerate(faceLms.landmark):
                     ih, iw, ic = img.shape
                     x, y = int(lm.x * iw), int(lm.y * ih)
                     face.append([x, y])
                 faces.append(face)
+        timer.end("postprocess")
         return img, faces
 
+    def getLandmarkArray(self, img):
+
+        # Last findFaceMesh result as a (faces, 468, 3) float array in pixels (z scaled like x), for FaceFeatureModule
+        if not self.results.multi_face_landmarks:
+            return np.empty((0, 468, 3), np.float32)
+        timer = MetricsModule.timer("FaceMeshDetector.getLandmarkArray")
+        h, w = img.shape[:2]
+        lm = np.array([[(p.x, p.y, p.z) for p in faceLms.landmark] for faceLms in self.results.multi_face_landmarks],
+                      dtype=np.float32) * np.array([w, h, w], np.float32)
+        timer.end()
+        return lm
+
     def findDistance(self,p1, p2, img=None):
 
+        timer = MetricsModule.timer("FaceMeshDetector.findDistance")
         x1, y1 = p1
         x2, y2 = p2
         cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
-        length = math.hypot(x2 - x1, y2 - y1)
+        length = GeometryModule.findDistance(p1, p2)
         info = (x1, y1, x2, y2, cx, cy)
         if img is not None:
-            cv2.circle(img, (x1, y1), 15, (255, 0, 255), cv2.FILLED)
-            cv2.circle(img, (x2, y2), 15, (255, 0, 255), cv2.FILLED)
-            cv2.line(img, (x1, y1), (x2, y2), (255, 0, 255), 3)
-            cv2.circle(img, (cx, cy), 15, (255, 0, 255), cv2.FILLED)
+            DrawModule.circle(img, (x1, y1), 15, (255, 0, 255), cv2.FILLED)
+            DrawModule.circle(img, (x2, y2), 15, (255, 0, 255), cv2.FILLED)
+            DrawModule.line(img, (x1, y1), (x2, y2), (255, 0, 255), 3)
+            DrawModule.circle(img, (cx, cy), 15, (255, 0, 255), cv2.FILLED)
+            timer.end()
             return length,info, img
         else:
+            timer.end()
             return length, info
 
 
@@ -0,0 +1,129 @@
+import math
+
+import numpy as np
+
+# Joint angles as (first, vertex, last) landmark ids, same convention as PoseDetector.findAngle
+POSE_ANGLES = {
+    "leftElbow": (11, 13, 15),
+    "rightElbow": (12, 14, 16),
+    "leftShoulder": (23, 11, 13),
+    "rightShoulder": (24, 12, 14),
+    "leftWrist": (13, 15, 19),
+    "rightWrist": (14, 16, 20),
+    "leftHip": (11, 23, 25),
+    "rightHip": (12, 24, 26),
+    "leftKnee": (23, 25, 27),
+    "rightKnee": (24, 26, 28),
+    "leftAnkle": (25, 27, 31),
+    "rightAnkle": (26, 28, 32),
+}
+
+# Distances as (from, to) landmark ids
+POSE_DISTANCES = {
+    "shoulderWidth": (11, 12),
+    "hipWidth": (23, 24),
+    "leftUpperArm": (11, 13),
+    "rightUpperArm": (12, 14),
+    "leftForearm": (13, 15),
+    "rightForearm": (14, 16),
+    "leftThigh": (23, 25),
+    "rightThigh": (24, 26),
+    "leftShin": (25, 27),
+    "rightShin": (26, 28),
+    "wristToWrist": (15, 16),
+    "ankleToAnkle": (27, 28),
+}
+
+
+def _specIds(spec, size):
+
+    # Accept a {name: ids} table or a plain list of id tuples
+    ids = list(spec.values()) if isinstance(spec, dict) else list(spec)
+    ids = np.asarray(ids, dtype=np.intp).reshape(-1, size)
+    return [ids[:, i] for i in range(size)]
+
+
+def _isPoint(p):
+
+    # A single (x, y[, z]) point, e.g. lmList[8] or lmList[8][0:2], as opposed to an array of points
+    return p.ndim == 1 if isinstance(p, np.ndarray) else not hasattr(p[0], "__len__")
+
+
+def findAngle(p1, p2, p3):
+
+    # Angle at p2 in degrees [0, 360). Single points use math, arrays of points shaped (..., 2|3) are done
+    # in one NumPy call.
+    if _isPoint(p1):
+        angle = math.degrees(math.atan2(p3[1] - p2[1], p3[0] - p2[0]) - math.atan2(p1[1] - p2[1], p1[0] - p2[0]))
+        return angle + 360 if angle < 0 else angle
+    p1, p2, p3 = (np.asarray(p, dtype=np.float64) for p in (p1, p2, p3))
+    angle = np.degrees(np.arctan2(p3[..., 1] - p2[..., 1], p3[..., 0] - p2[..., 0]) -
+                       np.arctan2(p1[..., 1] - p2[..., 1], p1[..., 0] - p2[..., 0]))
+    return np.where(angle < 0, angle + 360, angle)
+
+
+def findDistance(p1, p2):
+
+    # 2D distance, for single points or arrays of points shaped (..., 2|3)
+    if _isPoint(p1):
+        return math.hypot(p2[0] - p1[0], p2[1] - p1[1])
+    d = np.asarray(p2, dtype=np.float64)[..., :2] - np.asarray(p1, dtype=np.float64)[..., :2]
+    return np.hypot(d[..., 0], d[..., 1])
+
+
+def _landmarkArray(landmarks):
+
+    # An empty lmList (nobody detected) becomes zero frames of zero landmarks
+    lm = np.asarray(landmarks, dtype=np.float32)
+    return lm.reshape(0, 0, 3) if lm.size == 0 and lm.ndim < 2 else lm
+
+
+def findAngles(landmarks, spec=POSE_ANGLES):
+
+    # landmarks: (..., numLandmarks, 2|3), e.g. (frames, 33, 3). Returns (..., len(spec)) in degrees [0, 360).
+    lm = _landmarkArray(landmarks)
+    a, b, c = _specIds(spec, 3)
+    if lm.size == 0:
+        return np.empty(lm.shape[:-2] + (len(a),))
+    return findAngle(lm[..., a, :2], lm[..., b, :2], lm[..., c, :2])
+
+
+def findDistances(landmarks, spec=POSE_DISTANCES):
+
+    # landmarks: (..., numLandmarks, 2|3). Returns (..., len(spec)) 2D distances in the landmark units.
+    lm = _landmarkArray(landmarks)
+    a, b = _specIds(spec, 2)
+    if lm.size == 0:
+        return np.empty(lm.shape[:-2] + (len(a),))
+    return findDistance(lm[..., a, :2], lm[..., b, :2])
+
+
+def angleCheck(myAngle, targetAngle, offset=20):
+
+    # Works on scalars and on arrays; targetAngle and offset broadcast (e.g. one target per spec column)
+    myAngle = np.asarray(myAngle)
+    inRange = (myAngle > np.subtract(targetAngle, offset)) & (myAngle < np.add(targetAngle, offset))
+    if inRange.ndim == 0:
+        return bool(inRange)
+    return inRange
+
+
+def main():
+    # Score stored pose landmarks: (frames, 33, 3) array saved from PoseDetector.findPosition
+    frames = np.random.randint(0, 640, size=(100000, 33, 3))
+
+    # All joint angles and distances for every frame in one call each
+    angles = findAngles(frames, POSE_ANGLES)
+    distances = findDistances(frames, POSE_DISTANCES)
+    print(angles.shape, distances.shape)
+
+    # Check every frame against a target angle per joint
+    names = list(POSE_ANGLES)
+    targets = np.full(len(names), 90)
+    targets[names.index("leftElbow")] = 50
+    inRange = angleCheck(angles, targets, offset=10)
+    print({name: float(inRange[:, i].mean()) for i, name in enumerate(names)})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import numpy as np
+
+TIP_IDS = np.array([4, 8, 12, 16, 20])
+FINGER_NAMES = ["thumb", "index", "middle", "ring", "pinky"]
+
+
+def fingersUpBatch(landmarks, handTypes):
+
+    # landmarks: (N, 21, 2|3) hand landmarks, handTypes: N labels ("Left"/"Right") or a bool array, True for "Right".
+    # Same rules as HandDetector.fingersUp, for all hands at once. Returns an (N, 5) uint8 array.
+    lm = np.asarray(landmarks)
+    if lm.ndim == 2:
+        lm = lm[None]
+    handTypes = np.asarray(handTypes)
+    isRight = handTypes if handTypes.dtype == bool else handTypes == "Right"
+    isRight = np.broadcast_to(isRight, lm.shape[:1])
+
+    fingers = np.empty((lm.shape[0], 5), dtype=np.uint8)
+
+    # Thumb: tip left/right of the joint below it, depending on the hand
+    thumbTipX, thumbIpX = lm[:, TIP_IDS[0], 0], lm[:, TIP_IDS[0] - 1, 0]
+    fingers[:, 0] = np.where(isRight, thumbTipX > thumbIpX, thumbTipX < thumbIpX)
+
+    # 4 Fingers: tip above the pip joint
+    fingers[:, 1:] = lm[:, TIP_IDS[1:], 1] < lm[:, TIP_IDS[1:] - 2, 1]
+    return fingers
+
+
+def fingersToCode(fingers):
+
+    # (N, 5) bitmask to one integer per hand: thumb is bit 0, pinky is bit 4
+    return np.asarray(fingers, dtype=np.uint8) @ (1 << np.arange(5, dtype=np.uint8))
+
+
+class GestureRegistry:
+
+    def __init__(self, relative=False):
+
+        # relative=True measures distance constraints in palm lengths (wrist to middle finger base)
+        # instead of pixels, so the same gesture works at any distance from the camera
+        self.relative = relative
+        self.labels = []
+        self.constrained = []  # (gestureId, code, p1, p2, minDist, maxDist), checked in registration order
+        self.lut = np.full(32, -1, dtype=np.int32)  # code -> gestureId for gestures without constraints
+
+    def register(self, label, fingers, distance=None):
+
+        # fingers: five 0/1 values, thumb first. distance: optional (p1, p2, minDist, maxDist) landmark constraint
+        code = int(fingersToCode([fingers])[0])
+        gestureId = len(self.labels)
+        self.labels.append(label)
+        if distance is None:
+            if self.lut[code] != -1:
+                raise ValueError(f"Gesture '{self.labels[self.lut[code]]}' already uses fingers {list(fingers)}")
+            self.lut[code] = gestureId
+        else:
+            p1, p2, minDist, maxDist = distance
+            self.constrained.append((gestureId, code, p1, p2, minDist, maxDist))
+        return gestureId
+
+    def classifyIds(self, landmarks, handTypes):
+
+        # Returns one gesture id per hand, -1 where nothing matched
+        lm = np.asarray(landmarks, dtype=np.float32)
+        if lm.size == 0:
+            # No hands in the frame
+            return np.empty(0, np.int32)
+        if lm.ndim == 2:
+            lm = lm[None]
+        codes = fingersToCode(fingersUpBatch(lm, handTypes))
+        ids = np.full(len(codes), -1, dtype=np.int32)
+
+        # Gestures with a distance constraint are more specific, so they take precedence over the plain table
+        if self.constrained:
+            palm = np.linalg.norm(lm[:, 9, :2] - lm[:, 0, :2], axis=-1) if self.relative else None
+            for gestureId, code, p1, p2, minDist, maxDist in self.constrained:
+                rows = np.flatnonzero((codes == code) & (ids == -1))
+                if len(rows) == 0:
+                    continue
+                dist = np.linalg.norm(lm[rows, p2, :2] - lm[rows, p1, :2], axis=-1)
+                if palm is not None:
+                    dist = dist / np.maximum(palm[rows], 1e-6)
+                ids[rows[(dist >= minDist) & (dist <= maxDist)]] = gestureId
+
+        unmatched = ids == -1
+        ids[unmatched] = self.lut[codes[unmatched]]
+        return ids
+
+    def classify(self, landmarks, handTypes):
+
+        ids = self.classifyIds(landmarks, handTypes)
+        return [self.labels[i] if i >= 0 else None for i in ids]
+
+
+def defaultGestures():
+
+    registry = GestureRegistry(relative=True)
+    registry.register("fist", [0, 0, 0, 0, 0])
+    registry.register("open", [1, 1, 1, 1, 1])
+    registry.register("point", [0, 1, 0, 0, 0])
+    registry.register("peace", [0, 1, 1, 0, 0])
+    registry.register("thumbsUp", [1, 0, 0, 0, 0])
+    registry.register("rock", [0, 1, 0, 0, 1])
+    registry.register("callMe", [1, 0, 0, 0, 1])
+    registry.register("ok", [1, 0, 1, 1, 1], distance=(4, 8, 0, 0.35))
+    registry.register("pinch", [1, 1, 0, 0, 0], distance=(4, 8, 0, 0.35))
+    return registry
+
+
+def main():
+    import cv2
+    from dejancv.HandTrackingModule import HandDetector
+
+    cap = cv2.VideoCapture(0)
+    detector = HandDetector(maxHands=2)
+    gestures = defaultGestures()
+
+    while True:
+        success, img = cap.read()
+        hands, img = detector.findHands(img, draw=True)
+
+        if hands:
+            # All hands of the frame go through one vectorized call; stored (N, 21, 3) data works the same way
+            landmarks = np.array([hand["lmList"] for hand in hands])
+            handTypes = [hand["type"] for hand in hands]
+            labels = gestures.classify(landmarks, handTypes)
+
+            for hand, label in zip(hands, labels):
+                x, y, w, h = hand["bbox"]
+                cv2.putText(img, str(label), (x, y + h + 40), cv2.FONT_HERSHEY_PLAIN, 2, (0, 255, 0), 2)
+
+        cv2.imshow("Image", img)
+        cv2.waitKey(1)
+
+
+if __name__ == "__main__":
+    main()
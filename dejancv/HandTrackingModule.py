@@ -1,35 +1,55 @@
 
-import math
-
 import cv2
 import mediapipe as mp
 
+from dejancv import DrawModule, GeometryModule, MetricsModule
+from dejancv.GestureModule import fingersUpBatch
+from dejancv.Utils import prepareInput
+
 
 class HandDetector:
 
-    def __init__(self, staticMode=False, maxHands=2, modelComplexity=1, detectionCon=0.5, minTrackCon=0.5):
+    def __init__(self, staticMode=False, maxHands=2, modelComplexity=1, detectionCon=0.5, minTrackCon=0.5,
+                 processScale=1):
 
         self.staticMode = staticMode
         self.maxHands = maxHands
         self.modelComplexity = modelComplexity
         self.detectionCon = detectionCon
         self.minTrackCon = minTrackCon
+        self.processScale = processScale  # Run the model on a copy resized by this factor, results are in full-frame pixels
         self.mpHands = mp.solutions.hands
-        self.hands = self.mpHands.Hands(static_image_mode=self.staticMode,
-                                        max_num_hands=self.maxHands,
-                                        model_complexity=modelComplexity,
-                                        min_detection_confidence=self.detectionCon,
-                                        min_tracking_confidence=self.minTrackCon)
+        self.hands = self.buildGraph()
 
         self.mpDraw = mp.solutions.drawing_utils
         self.tipIds = [4, 8, 12, 16, 20]
         self.fingers = []
         self.lmList = []
 
+    def buildGraph(self):
+
+        return self.mpHands.Hands(static_image_mode=self.staticMode,
+                                  max_num_hands=self.maxHands,
+                                  model_complexity=self.modelComplexity,
+                                  min_detection_confidence=self.detectionCon,
+                                  min_tracking_confidence=self.minTrackCon)
+
+    def setModelComplexity(self, modelComplexity):
+
+        # MediaPipe fixes the complexity when the graph is built, so a change means a new graph (and lost tracking state)
+        if modelComplexity == self.modelComplexity:
+            return
+        self.hands.close()
+        self.modelComplexity = modelComplexity
+        self.hands = self.buildGraph()
+
     def findHands(self, img, draw=True, flipType=True):
 
-        imgRGB = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        timer = MetricsModule.timer("HandDetector.findHands")
+        imgRGB = prepareInput(img, self.processScale)
+        timer.lap("convert")
         self.results = self.hands.process(imgRGB)
+        timer.lap("inference")
         allHands = []
         h, w, c = img.shape
         if self.results.multi_hand_landmarks:
@@ -67,57 +87,42 @@ class HandDetector:
                 allHands.append(myHand)
 
                 ## draw
-                if draw:
-                    self.mpDraw.draw_landmarks(img, handLms,
-                                               self.mpHands.HAND_CONNECTIONS)
-                    cv2.rectangle(img, (bbox[0] - 20, bbox[1] - 20),
-                                  (bbox[0] + bbox[2] + 20, bbox[1] + bbox[3] + 20),
-                                  (255, 0, 255), 2)
-                    cv2.putText(img, myHand["type"], (bbox[0] - 30, bbox[1] - 30), cv2.FONT_HERSHEY_PLAIN,
-                                2, (255, 0, 255), 2)
-
+                if draw and DrawModule.isEnabled():
+                    DrawModule.drawLandmarks(img, handLms,
+                                             self.mpHands.HAND_CONNECTIONS)
+                    DrawModule.rectangle(img, (bbox[0] - 20, bbox[1] - 20),
+                                         (bbox[0] + bbox[2] + 20, bbox[1] + bbox[3] + 20),
+                                         (255, 0, 255), 2)
+                    DrawModule.putText(img, myHand["type"], (bbox[0] - 30, bbox[1] - 30), cv2.FONT_HERSHEY_PLAIN,
+                                       2, (255, 0, 255), 2)
+
+        timer.end("postprocess")
         return allHands, img
 
     def fingersUp(self, myHand):
 
+        timer = MetricsModule.timer("HandDetector.fingersUp")
         fingers = []
-        myHandType = myHand["type"]
-        myLmList = myHand["lmList"]
         if self.results.multi_hand_landmarks:
-
-            # Thumb
-            if myHandType == "Right":
-                if myLmList[self.tipIds[0]][0] > myLmList[self.tipIds[0] - 1][0]:
-                    fingers.append(1)
-                else:
-                    fingers.append(0)
-            else:
-                if myLmList[self.tipIds[0]][0] < myLmList[self.tipIds[0] - 1][0]:
-                    fingers.append(1)
-                else:
-                    fingers.append(0)
-
-            # 4 Fingers
-            for id in range(1, 5):
-                if myLmList[self.tipIds[id]][1] < myLmList[self.tipIds[id] - 2][1]:
-                    fingers.append(1)
-                else:
-                    fingers.append(0)
+            fingers = fingersUpBatch([myHand["lmList"]], [myHand["type"]])[0].tolist()
+        timer.end()
         return fingers
 
     def findDistance(self, p1, p2, img=None, color=(255, 0, 255), scale=5):
 
+        timer = MetricsModule.timer("HandDetector.findDistance")
         x1, y1 = p1
         x2, y2 = p2
         cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
-        length = math.hypot(x2 - x1, y2 - y1)
+        length = GeometryModule.findDistance(p1, p2)
         info = (x1, y1, x2, y2, cx, cy)
-        if img is not None:
-            cv2.circle(img, (x1, y1), scale, color, cv2.FILLED)
-            cv2.circle(img, (x2, y2), scale, color, cv2.FILLED)
-            cv2.line(img, (x1, y1), (x2, y2), color, max(1, scale // 3))
-            cv2.circle(img, (cx, cy), scale, color, cv2.FILLED)
+        if img is not None and DrawModule.isEnabled():
+            DrawModule.circle(img, (x1, y1), scale, color, cv2.FILLED)
+            DrawModule.circle(img, (x2, y2), scale, color, cv2.FILLED)
+            DrawModule.line(img, (x1, y1), (x2, y2), color, max(1, scale // 3))
+            DrawModule.circle(img, (cx, cy), scale, color, cv2.FILLED)
 
+        timer.end()
         return length, info, img
 
 
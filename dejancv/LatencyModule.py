@@ -0,0 +1,200 @@
+import collections
+import os
+import sys
+import threading
+import time
+import tty
+
+import cv2
+
+from dejancv.MetricsModule import Histogram
+
+STAGES = ("capture", "detect", "control", "send", "transport", "total")
+
+
+class PtyLoopback:
+
+    def __init__(self):
+
+        # A pseudo terminal stands in for the Arduino: SerialObject opens the slave side, we read the master side
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.pending = collections.deque()  # (stamp, expected length) of messages written but not yet received
+        self.lock = threading.Lock()
+        self.buffer = b""
+        self.onArrival = None  # Called with (stamp, arrival time) for every complete message
+        self.running = True
+        self.thread = threading.Thread(target=self.reader, daemon=True)
+        self.thread.start()
+
+    def expect(self, stamp, length):
+
+        with self.lock:
+            self.pending.append((stamp, length))
+
+    def cancel(self, stamp):
+
+        # The write failed, nothing of this message will arrive
+        with self.lock:
+            self.pending = collections.deque(p for p in self.pending if p[0] is not stamp)
+
+    def reader(self):
+
+        while self.running:
+            try:
+                chunk = os.read(self.master, 4096)
+            except OSError:
+                break
+            now = time.perf_counter()
+            self.buffer += chunk
+            # Messages have no terminator, so they are matched in order by their expected length
+            with self.lock:
+                while self.pending and len(self.buffer) >= self.pending[0][1]:
+                    stamp, length = self.pending.popleft()
+                    self.buffer = self.buffer[length:]
+                    if self.onArrival is not None:
+                        self.onArrival(stamp, now)
+
+    def close(self):
+
+        self.running = False
+        os.close(self.slave)
+        os.close(self.master)
+
+
+def messageLength(data, digits):
+
+    # Same format as SerialObject.sendData: "$" followed by every value zero padded to digits
+    return 1 + sum(len(str(int(d)).zfill(digits)) for d in data)
+
+
+class LatencyHarness:
+
+    def __init__(self, source, detector=None, pids=None, serialObject=None, realtime=True):
+
+        self.source = source  # Video file replayed for reproducible runs
+        self.realtime = realtime  # Pace frames at the video's frame rate, like a camera would deliver them
+        if detector is None:
+            from dejancv.FaceDetectionModule import FaceDetector
+            detector = FaceDetector(minDetectionCon=0.5)
+        self.detector = detector
+        self.pids = pids  # (xPID, yPID); built for the video size in run() when None
+
+        self.loopback = None
+        if serialObject is None:
+            from dejancv.SerialModule import SerialObject
+            self.loopback = PtyLoopback()
+            serialObject = SerialObject(portNo=self.loopback.port, baudRate=115200, digits=3, max_retries=1)
+            self.loopback.onArrival = self.arrived
+        self.serial = serialObject
+
+        self.stages = {name: Histogram() for name in STAGES}
+        self.counts = {"frames": 0, "commands": 0, "noDetection": 0, "received": 0, "sendErrors": 0}
+        self.done = threading.Condition()
+
+    def arrived(self, stamp, now):
+
+        # Runs on the loopback reader thread
+        self.stages["transport"].observe(now - stamp["sent"])
+        self.stages["total"].observe(now - stamp["capture"])
+        with self.done:
+            self.counts["received"] += 1
+            self.done.notify_all()
+
+    def run(self, maxFrames=None):
+
+        from dejancv.PIDModule import PID
+
+        cap = cv2.VideoCapture(self.source)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30
+        w, h = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if self.pids is None:
+            self.pids = (PID([1, 0.000000000001, 1], w // 2),
+                         PID([1, 0.000000000001, 1], h // 2, axis=1, limit=[-100, 100]))
+        xPID, yPID = self.pids
+
+        start = time.perf_counter()
+        while maxFrames is None or self.counts["frames"] < maxFrames:
+            if self.realtime:
+                # The frame "arrives" at its timestamp in the video, not as soon as we are ready for it
+                due = start + self.counts["frames"] / fps
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            t0 = time.perf_counter()
+            success, img = cap.read()
+            if not success:
+                break
+            stamp = {"id": self.counts["frames"], "capture": time.perf_counter()}
+            self.counts["frames"] += 1
+            self.stages["capture"].observe(stamp["capture"] - t0)
+
+            img, bboxs = self.detector.findFaces(img, draw=False)
+            stamp["detected"] = time.perf_counter()
+            self.stages["detect"].observe(stamp["detected"] - stamp["capture"])
+            if not bboxs:
+                self.counts["noDetection"] += 1
+                continue
+
+            cx, cy = bboxs[0]["center"]
+            data = [int(xPID.update(cx)), int(yPID.update(cy))]
+            stamp["controlled"] = time.perf_counter()
+            self.stages["control"].observe(stamp["controlled"] - stamp["detected"])
+
+            # Expected before writing, so the reply cannot arrive before it is registered
+            if self.loopback is not None:
+                self.loopback.expect(stamp, messageLength(data, self.serial.digits))
+            stamp["sent"] = time.perf_counter()
+            if not self.serial.sendData(data):
+                # Otherwise every later message would be matched with this one's stamp and length
+                if self.loopback is not None:
+                    self.loopback.cancel(stamp)
+                self.counts["sendErrors"] += 1
+                continue
+            self.stages["send"].observe(time.perf_counter() - stamp["sent"])
+            self.counts["commands"] += 1
+
+        cap.release()
+        # Let the last commands arrive before reporting
+        with self.done:
+            self.done.wait_for(lambda: self.counts["received"] >= self.counts["commands"], timeout=1)
+        return self.report()
+
+    def report(self):
+
+        # Milliseconds per stage; transport and total are measured on arrival at the loopback
+        out = {}
+        for name, hist in self.stages.items():
+            s = hist.summary()
+            out[name] = {k: s[k] * 1000 for k in ("mean", "p50", "p90", "p99", "max")}
+            out[name]["count"] = s["count"]
+        out["counts"] = dict(self.counts)
+        return out
+
+    def close(self):
+
+        if self.loopback is not None:
+            self.serial.ser.close()
+            self.loopback.close()
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("usage: python -m dejancv.LatencyModule <video> [maxFrames] [--fast]")
+        return
+    maxFrames = int(sys.argv[2]) if len(sys.argv) > 2 and sys.argv[2].isdigit() else None
+
+    harness = LatencyHarness(sys.argv[1], realtime="--fast" not in sys.argv)
+    report = harness.run(maxFrames)
+    harness.close()
+
+    print(f"{'stage':<10} {'mean':>8} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}  (ms)")
+    for name in STAGES:
+        r = report[name]
+        print(f"{name:<10} {r['mean']:8.2f} {r['p50']:8.2f} {r['p90']:8.2f} {r['p99']:8.2f} {r['max']:8.2f}")
+    print(report["counts"])
+
+
+if __name__ == "__main__":
+    main()
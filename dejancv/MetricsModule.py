@@ -0,0 +1,278 @@
+import bisect
+import json
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+# Upper bounds of the histogram buckets: seconds for stage timings, bytes for allocation samples
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+MEMORY_BUCKETS = (1 << 10, 1 << 12, 1 << 14, 1 << 16, 1 << 18, 1 << 20, 1 << 22, 1 << 24, 1 << 26)
+
+_enabled = False
+_memoryEvery = 0  # Sample allocations on every n-th call of a method, 0 turns tracemalloc off
+_local = threading.local()
+
+
+class Histogram:
+
+    def __init__(self, buckets=TIME_BUCKETS, keep=2048):
+
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        self.recent = deque(maxlen=keep)  # Latest raw values, for exact percentiles
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+
+        with self.lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+            self.min = min(self.min, value)
+            self.max = max(self.max, value)
+            self.recent.append(value)
+
+    def percentile(self, q):
+
+        # q in [0, 100], over the most recent values
+        with self.lock:
+            values = sorted(self.recent)
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+    def summary(self):
+
+        return {"count": self.count, "sum": self.sum, "mean": self.sum / self.count if self.count else 0.0,
+                "min": self.min if self.count else 0.0, "max": self.max,
+                "p50": self.percentile(50), "p90": self.percentile(90), "p99": self.percentile(99),
+                "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], self.counts))}
+
+
+class Registry:
+
+    def __init__(self):
+
+        self.histograms = {}  # (metric, method, stage) -> Histogram
+        self.counters = {}  # (metric, method) -> int
+        self.lock = threading.Lock()
+
+    def histogram(self, metric, method, stage="", buckets=TIME_BUCKETS):
+
+        key = (metric, method, stage)
+        hist = self.histograms.get(key)
+        if hist is None:
+            with self.lock:
+                hist = self.histograms.setdefault(key, Histogram(buckets))
+        return hist
+
+    def observe(self, metric, method, stage, value, buckets=TIME_BUCKETS):
+
+        self.histogram(metric, method, stage, buckets).observe(value)
+
+    def increment(self, metric, method, amount=1):
+
+        with self.lock:
+            self.counters[(metric, method)] = self.counters.get((metric, method), 0) + amount
+
+    def clear(self):
+
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def toDict(self):
+
+        out = {"counters": {}, "histograms": {}}
+        for (metric, method), value in sorted(self.counters.items()):
+            out["counters"].setdefault(metric, {})[method] = value
+        for (metric, method, stage), hist in sorted(self.histograms.items()):
+            out["histograms"].setdefault(metric, {}).setdefault(method, {})[stage or "total"] = hist.summary()
+        return out
+
+    def toJSON(self, indent=None):
+
+        return json.dumps(self.toDict(), indent=indent)
+
+    def toPrometheus(self, prefix="dejancv"):
+
+        # Prometheus text exposition format, version 0.0.4
+        lines = []
+        counters = sorted(self.counters.items())
+        for metric in sorted({m for (m, _), _ in counters}):
+            lines.append(f"# TYPE {prefix}_{metric} counter")
+            for (m, method), value in counters:
+                if m == metric:
+                    lines.append(f'{prefix}_{metric}{{method="{method}"}} {value}')
+
+        histograms = sorted(self.histograms.items())
+        for metric in sorted({m for (m, _, _), _ in histograms}):
+            lines.append(f"# TYPE {prefix}_{metric} histogram")
+            for (m, method, stage), hist in histograms:
+                if m != metric:
+                    continue
+                labels = f'method="{method}",stage="{stage or "total"}"'
+                cumulative = 0
+                for bound, count in zip(list(hist.buckets) + ["+Inf"], hist.counts):
+                    cumulative += count
+                    lines.append(f'{prefix}_{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{prefix}_{metric}_sum{{{labels}}} {hist.sum}")
+                lines.append(f"{prefix}_{metric}_count{{{labels}}} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class Timer:
+
+    def __init__(self, method):
+
+        self.method = method
+        self.start = self.last = time.perf_counter()
+        self.drawStart = self.drawLast = getDrawTime()
+        self.memoryStart = None
+
+        calls = registry.counters.get(("calls_total", method), 0)
+        if _memoryEvery and calls % _memoryEvery == 0 and tracemalloc.is_tracing():
+            # The peak is process wide, so allocations from other threads running at the same time are included
+            tracemalloc.reset_peak()
+            self.memoryStart = tracemalloc.get_traced_memory()[0]
+
+    def lap(self, stage):
+
+        # Time since the previous lap goes to this stage, minus the time spent inside DrawModule calls
+        now = time.perf_counter()
+        drawNow = getDrawTime()
+        registry.observe("stage_seconds", self.method, stage, (now - self.last) - (drawNow - self.drawLast))
+        self.last, self.drawLast = now, drawNow
+
+    def end(self, stage=None):
+
+        if stage is not None:
+            self.lap(stage)
+        now = time.perf_counter()
+        drawn = getDrawTime() - self.drawStart
+        if drawn:
+            registry.observe("stage_seconds", self.method, "draw", drawn)
+        registry.observe("stage_seconds", self.method, "", now - self.start)
+        registry.increment("calls_total", self.method)
+
+        if self.memoryStart is not None:
+            peak = tracemalloc.get_traced_memory()[1]
+            registry.observe("allocated_bytes", self.method, "", max(0, peak - self.memoryStart), MEMORY_BUCKETS)
+
+
+class NullTimer:
+
+    # Returned while metrics are off: the instrumented methods only pay for a few no-op calls
+    def lap(self, stage):
+        pass
+
+    def end(self, stage=None):
+        pass
+
+
+_nullTimer = NullTimer()
+
+
+def timer(method):
+
+    return Timer(method) if _enabled else _nullTimer
+
+
+def enable(memoryEvery=0):
+
+    # memoryEvery: sample allocations on every n-th call with tracemalloc. Tracing slows every allocation
+    # in the process while it runs, so it is off unless asked for.
+    global _enabled, _memoryEvery
+    _enabled = True
+    _memoryEvery = memoryEvery
+    if memoryEvery and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+
+    global _enabled, _memoryEvery
+    _enabled = False
+    if _memoryEvery and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _memoryEvery = 0
+
+
+def isEnabled():
+
+    return _enabled
+
+
+def addDrawTime(seconds):
+
+    # Called by DrawModule so drawing is reported as its own stage
+    _local.drawTime = getattr(_local, "drawTime", 0.0) + seconds
+
+
+def getDrawTime():
+
+    return getattr(_local, "drawTime", 0.0)
+
+
+def serve(port=9100, host="127.0.0.1"):
+
+    # /metrics answers in Prometheus text format, /metrics.json with the full summaries. Runs on a daemon thread.
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, contentType = registry.toPrometheus().encode(), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, contentType = registry.toJSON().encode(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", contentType)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    import cv2
+    from dejancv.HandTrackingModule import HandDetector
+
+    cap = cv2.VideoCapture(0)
+    detector = HandDetector(maxHands=2)
+
+    # Time every stage, sample allocations every 50 calls, and expose the results on http://127.0.0.1:9100/metrics
+    enable(memoryEvery=50)
+    server = serve(9100)
+
+    while True:
+        success, img = cap.read()
+        hands, img = detector.findHands(img, draw=True)
+
+        cv2.imshow("Image", img)
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            break
+
+    print(registry.toJSON(indent=2))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ import cv2
 import numpy as np
 import time
 from cvzone.FaceDetectionModule import FaceDetector
+from dejancv import DrawModule
 
 
 class PID:
@@ -33,15 +34,18 @@ class PID:
         return result
 
     def draw(self, img, cVal):
+        if not DrawModule.isEnabled():
+            return img
+
         h, w, _ = img.shape
         if self.axis == 0:
-            cv2.line(img, (self.targetVal, 0), (self.targetVal, h), (255, 0, 255), 1)
-            cv2.line(img, (self.targetVal, cVal[1]), (cVal[0], cVal[1]), (255, 0, 255), 1, 0)
+            DrawModule.line(img, (self.targetVal, 0), (self.targetVal, h), (255, 0, 255), 1)
+            DrawModule.line(img, (self.targetVal, cVal[1]), (cVal[0], cVal[1]), (255, 0, 255), 1, 0)
         else:
-            cv2.line(img, (0, self.targetVal), (w, self.targetVal), (255, 0, 255), 1)
-            cv2.line(img, (cVal[0], self.targetVal), (cVal[0], cVal[1]), (255, 0, 255), 1, 0)
+            DrawModule.line(img, (0, self.targetVal), (w, self.targetVal), (255, 0, 255), 1)
+            DrawModule.line(img, (cVal[0], self.targetVal), (cVal[0], cVal[1]), (255, 0, 255), 1, 0)
 
-        cv2.circle(img, tuple(cVal), 5, (255, 0, 255), cv2.FILLED)
+        DrawModule.circle(img, tuple(cVal), 5, (255, 0, 255), cv2.FILLED)
 
         return img
 
@@ -0,0 +1,194 @@
+import importlib
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from dejancv.MetricsModule import Histogram
+
+# kind -> (module, class, MediaPipe graph attribute, warm-up call)
+DETECTORS = {
+    "hands": ("dejancv.HandTrackingModule", "HandDetector", "hands",
+              lambda d, img: d.findHands(img, draw=False)),
+    "faceMesh": ("dejancv.FaceMeshModule", "FaceMeshDetector", "faceMesh",
+                 lambda d, img: d.findFaceMesh(img, draw=False)),
+    "pose": ("dejancv.PoseModule", "PoseDetector", "pose",
+             lambda d, img: d.findPose(img, draw=False)),
+    "face": ("dejancv.FaceDetectionModule", "FaceDetector", "faceDetection",
+             lambda d, img: d.findFaces(img, draw=False)),
+    "segmentation": ("dejancv.SelfiSegmentationModule", "SelfiSegmentation", "selfieSegmentation",
+                     lambda d, img: d.removeBG(img)),
+}
+
+
+class DetectorPool:
+
+    def __init__(self, maxIdle=8, maxIdleTime=300, warmupShape=(480, 640, 3)):
+
+        self.maxIdle = maxIdle  # Idle detectors kept over all configurations, the longest idle is closed first
+        self.maxIdleTime = maxIdleTime  # Seconds an idle detector is kept before its graph is closed
+        self.warmupShape = warmupShape  # Frame size for the first process call, None skips warm-up
+
+        self.idle = {}  # key -> list of (detector, idle since), most recently returned last
+        self.leased = {}  # id(detector) -> key
+        self.lock = threading.Lock()
+        self.createTime = Histogram()
+        self.warmupTime = Histogram()
+        self.stats = {"checkouts": 0, "hits": 0, "created": 0, "evicted": 0}
+
+    @staticmethod
+    def makeKey(kind, kwargs):
+
+        if kind not in DETECTORS:
+            raise ValueError(f"Unknown detector '{kind}', use one of {', '.join(DETECTORS)}")
+        return kind, tuple(sorted((name, DetectorPool.freeze(value)) for name, value in kwargs.items()))
+
+    @staticmethod
+    def freeze(value):
+
+        # Option values become part of the key, unhashable ones (lists, dicts) by their repr
+        try:
+            hash(value)
+        except TypeError:
+            return repr(value)
+        return value
+
+    def create(self, kind, kwargs):
+
+        moduleName, className, _, warmup = DETECTORS[kind]
+        start = time.perf_counter()
+        detector = getattr(importlib.import_module(moduleName), className)(**kwargs)
+        self.createTime.observe(time.perf_counter() - start)
+
+        # The first process call loads the models and allocates the graph's buffers, pay for it here
+        if self.warmupShape is not None:
+            start = time.perf_counter()
+            warmup(detector, np.zeros(self.warmupShape, np.uint8))
+            self.warmupTime.observe(time.perf_counter() - start)
+            self.reset(kind, detector)
+        with self.lock:
+            self.stats["created"] += 1
+        return detector
+
+    @staticmethod
+    def reset(kind, detector):
+
+        # Drop tracking state so the next user starts like with a fresh detector
+        graph = getattr(detector, DETECTORS[kind][2])
+        if hasattr(graph, "reset"):
+            graph.reset()
+        detector.results = None
+
+    @staticmethod
+    def closeDetector(kind, detector):
+
+        getattr(detector, DETECTORS[kind][2]).close()
+
+    def checkout(self, kind, **kwargs):
+
+        # kwargs are the detector's own constructor arguments, e.g. checkout("hands", maxHands=1)
+        key = self.makeKey(kind, kwargs)
+        with self.lock:
+            self.stats["checkouts"] += 1
+            entries = self.idle.get(key)
+            detector = entries.pop()[0] if entries else None
+            if detector is not None:
+                self.stats["hits"] += 1
+        if detector is None:
+            detector = self.create(kind, kwargs)
+        with self.lock:
+            self.leased[id(detector)] = key
+        self.evict()
+        return detector
+
+    def checkin(self, detector):
+
+        with self.lock:
+            key = self.leased.pop(id(detector))
+        self.reset(key[0], detector)
+        with self.lock:
+            self.idle.setdefault(key, []).append((detector, time.monotonic()))
+        self.evict()
+
+    @contextmanager
+    def lease(self, kind, **kwargs):
+
+        detector = self.checkout(kind, **kwargs)
+        try:
+            yield detector
+        finally:
+            self.checkin(detector)
+
+    def evict(self):
+
+        # Close detectors idle for too long, then the longest idle ones while over maxIdle
+        now = time.monotonic()
+        closing = []
+        with self.lock:
+            entries = sorted(((since, key, i) for key, items in self.idle.items() for i, (_, since) in enumerate(items)),
+                             key=lambda entry: entry[0])
+            over = len(entries) - self.maxIdle
+            for n, (since, key, i) in enumerate(entries):
+                if n < over or now - since > self.maxIdleTime:
+                    closing.append((key, self.idle[key][i][0]))
+            for key, detector in closing:
+                self.idle[key] = [item for item in self.idle[key] if item[0] is not detector]
+                if not self.idle[key]:
+                    del self.idle[key]
+            self.stats["evicted"] += len(closing)
+        for key, detector in closing:
+            self.closeDetector(key[0], detector)
+
+    def prewarm(self, kind, count=1, **kwargs):
+
+        # Build detectors ahead of the first request, e.g. at service start
+        detectors = [self.checkout(kind, **kwargs) for _ in range(count)]
+        for detector in detectors:
+            self.checkin(detector)
+
+    def getStats(self):
+
+        with self.lock:
+            stats = dict(self.stats)
+            stats["idle"] = sum(len(items) for items in self.idle.values())
+            stats["leased"] = len(self.leased)
+        stats["createMs"] = {k: self.createTime.summary()[k] * 1000 for k in ("mean", "p50", "max")}
+        stats["warmupMs"] = {k: self.warmupTime.summary()[k] * 1000 for k in ("mean", "p50", "max")}
+        return stats
+
+    def close(self):
+
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for key, items in idle.items():
+            for detector, _ in items:
+                self.closeDetector(key[0], detector)
+
+
+# Shared by the whole process
+pool = DetectorPool()
+
+
+def main():
+    import sys
+    import cv2
+
+    # Service start: two warmed hand detectors ready for the first sessions
+    pool.prewarm("hands", count=2, staticMode=True, maxHands=1)
+    print(pool.getStats())
+
+    img = cv2.imread(sys.argv[1] if len(sys.argv) > 1 else "hand.jpg")
+    for _ in range(100):
+        # Per request: no graph construction, no first-call model load
+        start = time.perf_counter()
+        with pool.lease("hands", staticMode=True, maxHands=1) as detector:
+            hands, _ = detector.findHands(img, draw=False)
+        print(f"{(time.perf_counter() - start) * 1000:.1f} ms, {len(hands)} hands")
+
+    print(pool.getStats())
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
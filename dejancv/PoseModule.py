@@ -1,8 +1,13 @@
 
-import math
+from concurrent.futures import ThreadPoolExecutor
 
 import cv2
 import mediapipe as mp
+import numpy as np
+
+from dejancv import DrawModule, GeometryModule, MetricsModule
+from dejancv.TrackerModule import FaceTracker
+from dejancv.Utils import prepareInput, putTextCached
 
 
 class PoseDetector:
@@ -13,7 +18,8 @@ class PoseDetector:
                  enableSegmentation=False,
                  smoothSegmentation=True,
                  detectionCon=0.5,
-                 trackCon=0.5):
+                 trackCon=0.5,
+                 processScale=1):
 
         self.staticMode = staticMode
         self.modelComplexity = modelComplexity
@@ -22,28 +28,49 @@ class PoseDetector:
         self.smoothSegmentation = smoothSegmentation
         self.detectionCon = detectionCon
         self.trackCon = trackCon
+        # Run the model on a copy resized by this factor. Landmarks stay in full-frame pixels,
+        # the segmentation mask comes back at the reduced size.
+        self.processScale = processScale
 
         self.mpDraw = mp.solutions.drawing_utils
         self.mpPose = mp.solutions.pose
-        self.pose = self.mpPose.Pose(static_image_mode=self.staticMode,
-                                     model_complexity=self.modelComplexity,
-                                     smooth_landmarks=self.smoothLandmarks,
-                                     enable_segmentation=self.enableSegmentation,
-                                     smooth_segmentation=self.smoothSegmentation,
-                                     min_detection_confidence=self.detectionCon,
-                                     min_tracking_confidence=self.trackCon)
+        self.pose = self.buildGraph()
+
+    def buildGraph(self):
+
+        return self.mpPose.Pose(static_image_mode=self.staticMode,
+                                model_complexity=self.modelComplexity,
+                                smooth_landmarks=self.smoothLandmarks,
+                                enable_segmentation=self.enableSegmentation,
+                                smooth_segmentation=self.smoothSegmentation,
+                                min_detection_confidence=self.detectionCon,
+                                min_tracking_confidence=self.trackCon)
+
+    def setModelComplexity(self, modelComplexity):
+
+        # MediaPipe fixes the complexity when the graph is built, so a change means a new graph (and lost tracking state)
+        if modelComplexity == self.modelComplexity:
+            return
+        self.pose.close()
+        self.modelComplexity = modelComplexity
+        self.pose = self.buildGraph()
 
     def findPose(self, img, draw=True):
 
-        imgRGB = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        timer = MetricsModule.timer("PoseDetector.findPose")
+        imgRGB = prepareInput(img, self.processScale)
+        timer.lap("convert")
         self.results = self.pose.process(imgRGB)
+        timer.lap("inference")
         if self.results.pose_landmarks:
             if draw:
-                self.mpDraw.draw_landmarks(img, self.results.pose_landmarks,
-                                           self.mpPose.POSE_CONNECTIONS)
+                DrawModule.drawLandmarks(img, self.results.pose_landmarks,
+                                         self.mpPose.POSE_CONNECTIONS)
+        timer.end()
         return img
 
     def findPosition(self, img, draw=True, bboxWithHands=False):
+        timer = MetricsModule.timer("PoseDetector.findPosition")
         self.lmList = []
         self.bboxInfo = {}
         if self.results.pose_landmarks:
@@ -70,56 +97,221 @@ class PoseDetector:
             self.bboxInfo = {"bbox": bbox, "center": (cx, cy)}
 
             if draw:
-                cv2.rectangle(img, bbox, (255, 0, 255), 3)
-                cv2.circle(img, (cx, cy), 5, (255, 0, 0), cv2.FILLED)
+                DrawModule.rectangle(img, bbox, (255, 0, 255), 3)
+                DrawModule.circle(img, (cx, cy), 5, (255, 0, 0), cv2.FILLED)
 
+        timer.end()
         return self.lmList, self.bboxInfo
 
     def findDistance(self, p1, p2, img=None, color=(255, 0, 255), scale=5):
 
+        timer = MetricsModule.timer("PoseDetector.findDistance")
         x1, y1 = p1
         x2, y2 = p2
         cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
-        length = math.hypot(x2 - x1, y2 - y1)
+        length = GeometryModule.findDistance(p1, p2)
         info = (x1, y1, x2, y2, cx, cy)
 
-        if img is not None:
-            cv2.line(img, (x1, y1), (x2, y2), color, max(1, scale // 3))
-            cv2.circle(img, (x1, y1), scale, color, cv2.FILLED)
-            cv2.circle(img, (x2, y2), scale, color, cv2.FILLED)
-            cv2.circle(img, (cx, cy), scale, color, cv2.FILLED)
+        if img is not None and DrawModule.isEnabled():
+            DrawModule.line(img, (x1, y1), (x2, y2), color, max(1, scale // 3))
+            DrawModule.circle(img, (x1, y1), scale, color, cv2.FILLED)
+            DrawModule.circle(img, (x2, y2), scale, color, cv2.FILLED)
+            DrawModule.circle(img, (cx, cy), scale, color, cv2.FILLED)
 
+        timer.end()
         return length, img, info
 
     def findAngle(self,p1, p2, p3, img=None, color=(255, 0, 255), scale=5):
 
+        timer = MetricsModule.timer("PoseDetector.findAngle")
+
         # Get the landmarks
         x1, y1 = p1
         x2, y2 = p2
         x3, y3 = p3
 
         # Calculate the Angle
-        angle = math.degrees(math.atan2(y3 - y2, x3 - x2) -
-                             math.atan2(y1 - y2, x1 - x2))
-        if angle < 0:
-            angle += 360
+        angle = GeometryModule.findAngle(p1, p2, p3)
 
         # Draw
-        if img is not None:
-            cv2.line(img, (x1, y1), (x2, y2), (255, 255, 255), max(1,scale//5))
-            cv2.line(img, (x3, y3), (x2, y2), (255, 255, 255), max(1,scale//5))
-            cv2.circle(img, (x1, y1), scale, color, cv2.FILLED)
-            cv2.circle(img, (x1, y1), scale+5, color, max(1,scale//5))
-            cv2.circle(img, (x2, y2), scale, color, cv2.FILLED)
-            cv2.circle(img, (x2, y2), scale+5, color, max(1,scale//5))
-            cv2.circle(img, (x3, y3), scale, color, cv2.FILLED)
-            cv2.circle(img, (x3, y3), scale+5, color, max(1,scale//5))
-            cv2.putText(img, str(int(angle)), (x2 - 50, y2 + 50),
-                        cv2.FONT_HERSHEY_PLAIN, 2, color, max(1,scale//5))
+        if img is not None and DrawModule.isEnabled():
+            DrawModule.line(img, (x1, y1), (x2, y2), (255, 255, 255), max(1,scale//5))
+            DrawModule.line(img, (x3, y3), (x2, y2), (255, 255, 255), max(1,scale//5))
+            DrawModule.circle(img, (x1, y1), scale, color, cv2.FILLED)
+            DrawModule.circle(img, (x1, y1), scale+5, color, max(1,scale//5))
+            DrawModule.circle(img, (x2, y2), scale, color, cv2.FILLED)
+            DrawModule.circle(img, (x2, y2), scale+5, color, max(1,scale//5))
+            DrawModule.circle(img, (x3, y3), scale, color, cv2.FILLED)
+            DrawModule.circle(img, (x3, y3), scale+5, color, max(1,scale//5))
+            DrawModule.putText(img, str(int(angle)), (x2 - 50, y2 + 50),
+                               cv2.FONT_HERSHEY_PLAIN, 2, color, max(1,scale//5))
+        timer.end()
         return angle, img
 
+    def findAngles(self, lmList=None, spec=GeometryModule.POSE_ANGLES):
+        # All angles of a spec table at once; lmList may also be a (frames, 33, 3) array
+        if lmList is None:
+            lmList = self.lmList
+        return GeometryModule.findAngles(lmList, spec)
+
     def angleCheck(self, myAngle, targetAngle, offset=20):
-        return targetAngle - offset < myAngle < targetAngle + offset
+        return GeometryModule.angleCheck(myAngle, targetAngle, offset)
+
+
+class MultiPoseDetector:
+
+    def __init__(self, maxPeople=6, personDetector=None, modelComplexity=1, detectionCon=0.5, trackCon=0.5,
+                 padding=0.1, faceToBody=(3.5, 8.0), workers=None, maxAge=10):
+
+        # personDetector: callable(img) returning person boxes as (x, y, w, h) or dicts with a "bbox".
+        # None uses the face detector and grows every face box to body size (faceToBody = width, height in faces).
+        self.maxPeople = maxPeople
+        self.modelComplexity = modelComplexity
+        self.detectionCon = detectionCon
+        self.trackCon = trackCon
+        self.padding = padding  # Margin added around each person box before cropping, as a fraction of its size
+        self.faceToBody = faceToBody
+        if personDetector is None:
+            from dejancv.FaceDetectionModule import FaceDetector
+            faceDetector = FaceDetector(minDetectionCon=detectionCon, modelSelection=1)
+
+            def personDetector(img):
+                return faceDetector.findFaces(img, draw=False)[1]
+
+            self.expandFaces = True
+        else:
+            self.expandFaces = False
+        self.personDetector = personDetector
+
+        # Stable person ids; every id gets its own Pose graph so MediaPipe's temporal tracking stays per person
+        self.tracker = FaceTracker(maxAge=maxAge, minIou=0.2, maxCenterDist=0.5)
+        self.slots = {}  # person id -> PoseDetector
+        self.free = []  # Graphs of people who left, reused for the next new id
+        self.pool = ThreadPoolExecutor(workers or maxPeople)
+        self.mpPose = mp.solutions.pose
+
+    def expandFace(self, bbox):
+
+        # Face box to an estimated standing body box: centered under the face, starting half a face above it
+        x, y, bw, bh = bbox
+        bodyW, bodyH = bw * self.faceToBody[0], bh * self.faceToBody[1]
+        x1 = x + bw / 2 - bodyW / 2
+        y1 = y - bh / 2
+        return int(x1), int(y1), int(bodyW), int(bodyH)
+
+    def findPersonBoxes(self, img):
+
+        boxes = []
+        for box in self.personDetector(img):
+            bbox = box["bbox"] if isinstance(box, dict) else tuple(box)
+            if self.expandFaces:
+                bbox = self.expandFace(bbox)
+            boxes.append(bbox)
+        # Largest (closest) people first when there are more than maxPeople
+        boxes.sort(key=lambda b: b[2] * b[3], reverse=True)
+        return [{"bbox": b} for b in boxes[:self.maxPeople]]
+
+    def cropBox(self, bbox, h, w):
+
+        x, y, bw, bh = bbox
+        px, py = int(bw * self.padding), int(bh * self.padding)
+        x1, y1 = max(0, x - px), max(0, y - py)
+        x2, y2 = min(w, x + bw + px), min(h, y + bh + py)
+        return x1, y1, x2, y2
+
+    def getSlot(self, id):
+
+        slot = self.slots.get(id)
+        if slot is None:
+            if self.free:
+                slot = self.free.pop()
+                self.resetSlot(slot)
+            else:
+                slot = PoseDetector(modelComplexity=self.modelComplexity, detectionCon=self.detectionCon,
+                                    trackCon=self.trackCon)
+            self.slots[id] = slot
+        return slot
+
+    @staticmethod
+    def resetSlot(slot):
+
+        # A reused graph still tracks and smooths the person who left, the new id has to start fresh
+        if hasattr(slot.pose, "reset"):
+            slot.pose.reset()
+        else:
+            slot.pose.close()
+            slot.pose = slot.buildGraph()
+        slot.results = None
+
+    def releaseSlots(self):
+
+        # Graphs of tracks the tracker has forgotten go back to the free list
+        alive = {t.id for t in self.tracker.tracks}
+        for id in [id for id in self.slots if id not in alive]:
+            self.free.append(self.slots.pop(id))
+
+    @staticmethod
+    def runCrop(slot, imgRGB, crop):
+
+        x1, y1, x2, y2 = crop
+        if x2 <= x1 or y2 <= y1:
+            return None
+        results = slot.pose.process(np.ascontiguousarray(imgRGB[y1:y2, x1:x2]))
+        if not results.pose_landmarks:
+            return None
+        lm = np.array([(p.x, p.y, p.z) for p in results.pose_landmarks.landmark], dtype=np.float32)
+        # Crop-normalized coordinates to full-frame pixels
+        cw, ch = x2 - x1, y2 - y1
+        return lm * np.array([cw, ch, cw], np.float32) + np.array([x1, y1, 0], np.float32)
+
+    def findPeople(self, img, draw=True):
+
+        # Returns (ids, landmarks (people, 33, 3) in pixels, bboxs). People whose crop gave no pose are left out.
+        timer = MetricsModule.timer("MultiPoseDetector.findPeople")
+        h, w = img.shape[:2]
+        people = self.tracker.update(self.findPersonBoxes(img))
+        self.releaseSlots()
+        timer.lap("detect")
+
+        imgRGB = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        crops = [self.cropBox(p["bbox"], h, w) for p in people]
+        slots = [self.getSlot(p["id"]) for p in people]
+        # Every crop runs on its own graph, MediaPipe releases the GIL while processing
+        results = list(self.pool.map(self.runCrop, slots, [imgRGB] * len(people), crops))
+        timer.lap("inference")
+
+        ids, landmarks, bboxs = [], [], []
+        for person, lm in zip(people, results):
+            if lm is None:
+                continue
+            ids.append(person["id"])
+            landmarks.append(lm)
+            bboxs.append(person["bbox"])
+        landmarks = np.array(landmarks, np.float32).reshape(-1, 33, 3)
+
+        if draw and DrawModule.isEnabled():
+            for id, lm, bbox in zip(ids, landmarks, bboxs):
+                self.drawPerson(img, id, lm, bbox)
+        timer.end("postprocess")
+        return ids, landmarks, bboxs
+
+    def drawPerson(self, img, id, lm, bbox):
+
+        points = lm[:, :2].astype(int)
+        for a, b in self.mpPose.POSE_CONNECTIONS:
+            DrawModule.line(img, tuple(points[a]), tuple(points[b]), (255, 255, 255), 2)
+        for x, y in points:
+            DrawModule.circle(img, (x, y), 4, (0, 0, 255), cv2.FILLED)
+        putTextCached(img, f"Person {id}", (bbox[0], max(20, bbox[1] - 10)), cv2.FONT_HERSHEY_PLAIN,
+                      2, (255, 0, 255), 2)
+
+    def close(self):
+
+        self.pool.shutdown()
+        for slot in list(self.slots.values()) + self.free:
+            slot.pose.close()
+        self.slots.clear()
+        self.free.clear()
 
 
 def main():
@@ -184,5 +376,30 @@ def main():
         # Wait for 1 millisecond between each frame
         cv2.waitKey(1)
 
+
+def mainMulti():
+    # Several people at once, ids stay with the same person from frame to frame
+    cap = cv2.VideoCapture(0)
+    detector = MultiPoseDetector(maxPeople=6)
+
+    while True:
+        success, img = cap.read()
+        ids, landmarks, bboxs = detector.findPeople(img, draw=True)
+
+        # landmarks is a (people, 33, 3) array, so all joint angles of everyone come from one call
+        angles = GeometryModule.findAngles(landmarks)
+        for id, personAngles in zip(ids, angles):
+            print(id, personAngles.round())
+
+        cv2.imshow("Image", img)
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            break
+    detector.close()
+
+
 if __name__ == "__main__":
-    main()
+    import sys
+    if "--multi" in sys.argv:
+        mainMulti()
+    else:
+        main()
@@ -0,0 +1,169 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+from dejancv.MetricsModule import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class VideoRecorder:
+
+    def __init__(self, path, fps=30, fourcc="mp4v", maxQueue=64, segmentSeconds=None, segmentBytes=None):
+
+        # path may contain {index} for the segment number, otherwise it is added before the extension when rotating
+        self.path = path
+        self.fps = fps
+        self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+        self.segmentSeconds = segmentSeconds  # Start a new file after this much video, None for one file
+        self.segmentBytes = segmentBytes  # Start a new file once the current one reaches this size, None for no limit
+
+        self.queue = queue.Queue(maxsize=maxQueue)  # Bounded: when the disk stalls frames are dropped, not the loop
+        self.writer = None
+        self.size = None
+        self.segment = 0
+        self.segmentFrames = 0
+        self.segments = []  # Paths of every file written so far
+        self.encodeTime = Histogram()
+        self.stats = {"submitted": 0, "written": 0, "dropped": 0, "maxQueueDepth": 0}
+        self.error = None  # Exception that stopped the encode thread, raised again from write() and close()
+
+        self.thread = threading.Thread(target=self.worker, daemon=True)
+        self.thread.start()
+
+    def write(self, img, drawList=None, copy=True):
+
+        # Never blocks. Returns False when the queue is full and the frame was dropped.
+        # drawList: annotations recorded in deferred mode (DrawModule.takeDrawList()), rendered on the encode thread
+        if self.error is not None:
+            raise self.error
+        self.stats["submitted"] += 1
+        try:
+            self.queue.put_nowait((img.copy() if copy else img, drawList))
+        except queue.Full:
+            self.stats["dropped"] += 1
+            return False
+        self.stats["maxQueueDepth"] = max(self.stats["maxQueueDepth"], self.queue.qsize())
+        return True
+
+    def segmentPath(self, index):
+
+        if "{index" in self.path:
+            return self.path.format(index=index)
+        if self.segmentSeconds is None and self.segmentBytes is None:
+            return self.path
+        root, ext = os.path.splitext(self.path)
+        return f"{root}_{index:03d}{ext}"
+
+    def openSegment(self):
+
+        if self.writer is not None:
+            self.writer.release()
+        path = self.segmentPath(self.segment)
+        self.writer = cv2.VideoWriter(path, self.fourcc, self.fps, self.size)
+        if not self.writer.isOpened():
+            raise IOError(f"Could not open {path} for writing")
+        self.segments.append(path)
+        self.segment += 1
+        self.segmentFrames = 0
+
+    def needsRotation(self):
+
+        if self.segmentSeconds is not None and self.segmentFrames >= self.segmentSeconds * self.fps:
+            return True
+        # The file size is only checked once a second of video, the encoder buffers anyway
+        if self.segmentBytes is not None and self.segmentFrames % max(1, int(self.fps)) == 0:
+            return os.path.getsize(self.segments[-1]) >= self.segmentBytes
+        return False
+
+    def worker(self):
+
+        try:
+            self.encodeLoop()
+        except Exception as e:
+            # E.g. the file cannot be opened or the disk is full: keep the error for the caller
+            logger.error("VideoRecorder stopped: %s", e)
+            self.error = e
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+
+    def encodeLoop(self):
+
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            img, drawList = item
+            start = time.perf_counter()
+
+            if drawList is not None:
+                drawList.render(img)
+            if self.size is None:
+                self.size = (img.shape[1], img.shape[0])
+            if img.shape[1] != self.size[0] or img.shape[0] != self.size[1]:
+                img = cv2.resize(img, self.size)
+
+            if self.writer is None or (self.segmentFrames and self.needsRotation()):
+                self.openSegment()
+            self.writer.write(img)
+            self.segmentFrames += 1
+
+            self.encodeTime.observe(time.perf_counter() - start)
+            self.stats["written"] += 1
+
+    def getStats(self):
+
+        stats = dict(self.stats)
+        stats["queueDepth"] = self.queue.qsize()
+        stats["segments"] = list(self.segments)
+        stats["error"] = None if self.error is None else str(self.error)
+        stats["encodeMs"] = {k: self.encodeTime.summary()[k] * 1000 for k in ("mean", "p50", "p99", "max")}
+        return stats
+
+    def close(self):
+
+        # Writes everything still queued, then closes the file
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *exc):
+
+        self.close()
+
+
+def main():
+    from dejancv import DrawModule
+    from dejancv.HandTrackingModule import HandDetector
+
+    cap = cv2.VideoCapture(0)
+    detector = HandDetector(maxHands=2)
+
+    # Annotations are recorded, not drawn: the frame stays clean and the encode thread renders them
+    DrawModule.setDeferred()
+
+    # A new file every minute: hands_000.mp4, hands_001.mp4, ...
+    with VideoRecorder("hands.mp4", fps=30, segmentSeconds=60) as recorder:
+        for _ in range(30 * 60 * 3):
+            success, img = cap.read()
+            if not success:
+                break
+            hands, img = detector.findHands(img, draw=True)
+            recorder.write(img, DrawModule.takeDrawList(), copy=False)
+
+        print(recorder.getStats())
+
+
+if __name__ == "__main__":
+    main()
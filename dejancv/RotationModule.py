@@ -0,0 +1,133 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from dejancv.Utils import getRotation
+
+
+class Rotator:
+
+    def __init__(self, maxBuffers=8, workers=None):
+
+        self.maxBuffers = maxBuffers  # Output buffers kept for rotate(), one per (shape, angle, scale, keepSize)
+        self.workers = workers  # Threads for rotateBatch, None lets the executor decide
+        self.buffers = OrderedDict()
+        self.lock = threading.Lock()
+        self.pool = None
+
+    def rotate(self, img, angle, scale=1, keepSize=False):
+
+        # Same result as rotateImage, written into a reused buffer.
+        # The returned image is overwritten by the next call with the same settings, copy it to keep it.
+        h, w = img.shape[:2]
+        matrix, (newW, newH) = getRotation(h, w, angle, scale, keepSize)
+
+        key = (img.shape, img.dtype.str, angle, scale, keepSize)
+        with self.lock:
+            out = self.buffers.get(key)
+            if out is None:
+                out = np.empty((newH, newW) + img.shape[2:], img.dtype)
+                self.buffers[key] = out
+                while len(self.buffers) > self.maxBuffers:
+                    self.buffers.popitem(last=False)
+            else:
+                self.buffers.move_to_end(key)
+
+        cv2.warpAffine(img, matrix, (newW, newH), dst=out)
+        return out
+
+    def batchGeometry(self, shape, angles, scale=1, keepSize=False):
+
+        # One matrix per angle, all mapped onto a common canvas big enough for every angle
+        h, w = shape[:2]
+        rotations = [getRotation(h, w, float(angle), scale, keepSize) for angle in angles]
+        outW = max(size[0] for _, size in rotations)
+        outH = max(size[1] for _, size in rotations)
+
+        matrices = np.empty((len(rotations), 2, 3), np.float64)
+        for i, (matrix, (newW, newH)) in enumerate(rotations):
+            matrices[i] = matrix
+            # Center smaller results on the shared canvas
+            matrices[i, 0, 2] += (outW - newW) / 2
+            matrices[i, 1, 2] += (outH - newH) / 2
+        return matrices, (outW, outH)
+
+    def rotateBatch(self, imgs, angles, scale=1, keepSize=False, out=None):
+
+        # imgs: (N, h, w[, c]) array or list of same-size images. angles: one angle for all images or one per image.
+        # Returns (N, H, W[, c]); pass out to write into a preallocated array.
+        if len(imgs) == 0:
+            # Nothing to rotate: an empty array like for any other batch (or out, when given)
+            if out is not None:
+                return out
+            if isinstance(imgs, np.ndarray):
+                return np.empty((0,) + imgs.shape[1:], imgs.dtype)
+            return np.empty((0, 0, 0), np.uint8)
+        if len({img.shape for img in imgs}) > 1:
+            raise ValueError("rotateBatch needs images of the same size, use rotate() for mixed sizes")
+
+        angles = np.broadcast_to(np.asarray(angles, dtype=np.float64), (len(imgs),))
+        matrices, (outW, outH) = self.batchGeometry(imgs[0].shape, angles, scale, keepSize)
+
+        shape = (len(imgs), outH, outW) + imgs[0].shape[2:]
+        if out is None:
+            out = np.empty(shape, imgs[0].dtype)
+        elif out.shape != shape or out.dtype != imgs[0].dtype or not out.flags.c_contiguous:
+            # warpAffine would quietly write a non-contiguous out[i] into a new array instead
+            raise ValueError(f"out must be a C-contiguous {imgs[0].dtype} array of shape {shape}")
+
+        def work(i):
+            cv2.warpAffine(imgs[i], matrices[i], (outW, outH), dst=out[i])
+
+        # warpAffine releases the GIL, so a thread pool runs the rotations in parallel
+        with self.lock:
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(self.workers)
+            pool = self.pool
+        list(pool.map(work, range(len(imgs))))
+        return out
+
+    def rotateAngles(self, img, angles, scale=1, keepSize=False, out=None):
+
+        # One image rotated by every angle, e.g. to generate augmented training crops
+        return self.rotateBatch([img] * len(angles), angles, scale, keepSize, out)
+
+    def close(self):
+
+        with self.lock:
+            pool, self.pool = self.pool, None
+            self.buffers.clear()
+        if pool is not None:
+            pool.shutdown()
+
+
+def main():
+    cap = cv2.VideoCapture(0)
+    rotator = Rotator()
+
+    success, img = cap.read()
+
+    # Generate rotated training crops: one crop at 36 angles, into one preallocated array
+    crop = img[100:324, 100:324]
+    angles = np.arange(0, 360, 10)
+    crops = rotator.rotateAngles(crop, angles, keepSize=True)
+    print(crops.shape)
+
+    while True:
+        success, img = cap.read()
+
+        # Per-frame display rotation at a fixed angle, no new allocation per frame
+        imgRotated = rotator.rotate(img, 60)
+
+        cv2.imshow("imgRotated", imgRotated)
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            break
+
+    rotator.close()
+
+
+if __name__ == "__main__":
+    main()
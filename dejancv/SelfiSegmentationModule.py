@@ -3,32 +3,171 @@ import mediapipe as mp
 import numpy as np
 
 import cvzone
+from dejancv import MetricsModule
+from dejancv.Utils import prepareInput
+
+
+def guidedCoefficients(mask, guide, radius=8, eps=1e-3):
+
+    # Fast guided filter (He et al.): the linear model q = a * guide + b is fitted at the mask's resolution,
+    # then a and b are upsampled to the guide's size. mask: float32 (h, w) in [0, 1], guide: full-size gray float32.
+    h, w = mask.shape[:2]
+    H, W = guide.shape[:2]
+    guideLow = cv2.resize(guide, (w, h), interpolation=cv2.INTER_AREA) if (h, w) != (H, W) else guide
+    r = max(1, int(round(radius * w / W)))
+    size = (2 * r + 1, 2 * r + 1)
+
+    meanI = cv2.boxFilter(guideLow, -1, size)
+    meanP = cv2.boxFilter(mask, -1, size)
+    covIP = cv2.boxFilter(guideLow * mask, -1, size) - meanI * meanP
+    varI = cv2.boxFilter(guideLow * guideLow, -1, size) - meanI * meanI
+    a = covIP / (varI + eps)
+    b = meanP - a * meanI
+    a = cv2.boxFilter(a, -1, size)
+    b = cv2.boxFilter(b, -1, size)
+    if (h, w) != (H, W):
+        a = cv2.resize(a, (W, H), interpolation=cv2.INTER_LINEAR)
+        b = cv2.resize(b, (W, H), interpolation=cv2.INTER_LINEAR)
+    return a, b
 
 
 class SelfiSegmentation():
 
-    def __init__(self, model=1):
+    def __init__(self, model=1, processScale=1, interval=1, motionThreshold=None, guided=False,
+                 guidedRadius=8, guidedEps=1e-3):
 
         self.model = model
+        self.processScale = processScale  # Infer the mask on a copy resized by this factor
+        self.interval = interval  # Run the model every n-th frame and reuse the mask in between
+        self.motionThreshold = motionThreshold  # Mean change (gray levels) of a thumbnail that forces a new mask
+        self.guided = guided  # Upsample with a guided filter so mask edges follow the full-resolution frame
+        self.guidedRadius = guidedRadius
+        self.guidedEps = guidedEps
         self.mpDraw = mp.solutions.drawing_utils
         self.mpSelfieSegmentation = mp.solutions.selfie_segmentation
         self.selfieSegmentation = self.mpSelfieSegmentation.SelfieSegmentation(model_selection=self.model)
 
+        self.frameCount = 0
+        self.lastInference = None
+        self.lastShape = None
+        self.thumb = None
+        self.mask = None  # Full-size mask from the last inference (unguided mode)
+        self.coefficients = None  # Guided filter a, b from the last inference (guided mode)
+        self.stats = {"frames": 0, "inferences": 0, "motionRefreshes": 0}
+
+    def needsInference(self, img):
+
+        if self.lastInference is None or self.lastShape != img.shape:
+            return True
+        if self.frameCount - self.lastInference >= self.interval:
+            return True
+        if self.motionThreshold is not None:
+            thumb = cv2.resize(img, (32, 24), interpolation=cv2.INTER_AREA)
+            if cv2.norm(thumb, self.thumb, cv2.NORM_L1) / thumb.size > self.motionThreshold:
+                self.stats["motionRefreshes"] += 1
+                return True
+        return False
+
+    def applyGuided(self, img):
+
+        # The linear model overshoots a little around strong edges, clip back to [0, 1]
+        guide = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY).astype(np.float32) / 255
+        mask = self.coefficients[0] * guide
+        mask += self.coefficients[1]
+        return np.clip(mask, 0, 1, out=mask)
+
+    def getMask(self, img, timer=None):
+
+        # Float mask in [0, 1] at the size of img. Without guided, the mask is shared by the frames that
+        # reuse it and is read-only; copy it to modify it.
+        timer = MetricsModule.NullTimer() if timer is None else timer
+        self.frameCount += 1
+        self.stats["frames"] += 1
+        if self.needsInference(img):
+            imgRGB = prepareInput(img, self.processScale)
+            timer.lap("convert")
+            mask = self.selfieSegmentation.process(imgRGB).segmentation_mask
+            timer.lap("inference")
+
+            self.stats["inferences"] += 1
+            self.lastInference = self.frameCount
+            self.lastShape = img.shape
+            if self.motionThreshold is not None:
+                self.thumb = cv2.resize(img, (32, 24), interpolation=cv2.INTER_AREA)
+            if self.guided:
+                guide = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY).astype(np.float32) / 255
+                self.coefficients = guidedCoefficients(mask, guide, self.guidedRadius, self.guidedEps)
+                return self.applyGuided(img)
+            if mask.shape[:2] != img.shape[:2]:
+                mask = cv2.resize(mask, (img.shape[1], img.shape[0]), interpolation=cv2.INTER_LINEAR)
+            mask.flags.writeable = False
+            self.mask = mask
+            return mask
+
+        # Reused frame: the guided model is applied to the current frame, so edges move with the person
+        if self.guided:
+            return self.applyGuided(img)
+        return self.mask
+
     def removeBG(self, img, imgBg=(255, 255, 255), cutThreshold=0.1):
 
-        imgRGB = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        results = self.selfieSegmentation.process(imgRGB)
+        timer = MetricsModule.timer("SelfiSegmentation.removeBG")
+        mask = self.getMask(img, timer)
         condition = np.stack(
-            (results.segmentation_mask,) * 3, axis=-1) > cutThreshold
+            (mask,) * 3, axis=-1) > cutThreshold
         if isinstance(imgBg, tuple):
             _imgBg = np.zeros(img.shape, dtype=np.uint8)
             _imgBg[:] = imgBg
             imgOut = np.where(condition, img, _imgBg)
         else:
             imgOut = np.where(condition, img, imgBg)
+        timer.end("composite")
         return imgOut
 
 
+def benchmark(source, configs=None, numFrames=200, cutThreshold=0.1):
+
+    # CPU time per frame against mask quality, for each configuration. Quality is the IoU of the cut mask
+    # with the mask of the current path (full resolution, every frame) on the same frame.
+    import time
+    if configs is None:
+        configs = {
+            "scale 0.5": dict(processScale=0.5),
+            "scale 0.5 guided": dict(processScale=0.5, guided=True),
+            "every 3rd": dict(interval=3),
+            "every 3rd + motion": dict(interval=3, motionThreshold=4),
+            "scale 0.5 every 3rd guided": dict(processScale=0.5, interval=3, guided=True),
+            "scale 0.25 every 5th guided + motion": dict(processScale=0.25, interval=5, guided=True,
+                                                         motionThreshold=4),
+        }
+
+    cap = cv2.VideoCapture(source)
+    frames = []
+    while len(frames) < numFrames:
+        success, img = cap.read()
+        if not success:
+            break
+        frames.append(img)
+    cap.release()
+
+    def run(segmentor):
+        masks = []
+        cpu = time.process_time()
+        for img in frames:
+            masks.append(segmentor.getMask(img) > cutThreshold)
+        return masks, (time.process_time() - cpu) / len(frames) * 1000
+
+    reference, referenceMs = run(SelfiSegmentation())
+    print(f"{'configuration':<40} {'cpu ms':>8} {'IoU':>6} {'inferences':>10}")
+    print(f"{'current (full res, every frame)':<40} {referenceMs:8.2f} {1:6.3f} {len(frames):>10}")
+    for name, kwargs in configs.items():
+        segmentor = SelfiSegmentation(**kwargs)
+        masks, ms = run(segmentor)
+        iou = np.mean([np.logical_and(m, r).sum() / max(1, np.logical_or(m, r).sum())
+                       for m, r in zip(masks, reference)])
+        print(f"{name:<40} {ms:8.2f} {iou:6.3f} {segmentor.stats['inferences']:>10}")
+
+
 def main():
     # Initialize the webcam. '2' indicates the third camera connected to the computer.
     # '0' usually refers to the built-in camera.
@@ -66,4 +205,8 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    import sys
+    if len(sys.argv) > 2 and sys.argv[1] == "--benchmark":
+        benchmark(sys.argv[2])
+    else:
+        main()
@@ -0,0 +1,382 @@
+import logging
+import os
+import queue
+import selectors
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import serial
+import serial.tools.list_ports
+
+from dejancv.MetricsModule import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+def encodeData(data, digits):
+
+    # Same format as SerialObject.sendData: "$" followed by every value zero padded to digits
+    return ("$" + "".join(str(int(d)).zfill(digits) for d in data)).encode()
+
+
+def openSerial(port, baudRate):
+
+    # Non-blocking: the hub's I/O thread only reads and writes when the selector says the port is ready.
+    # Needs selectable ports, i.e. POSIX (Linux, macOS, Raspberry Pi); Windows COM handles are not.
+    return serial.Serial(port, baudRate, timeout=0, write_timeout=0)
+
+
+class SerialDevice:
+
+    def __init__(self, name, port, baudRate, digits, maxQueue, maxIncoming):
+
+        self.name = name
+        self.port = port
+        self.baudRate = baudRate
+        self.digits = digits
+        self.maxQueue = maxQueue
+        self.ser = None
+        self.fd = None
+        self.opening = False  # Opened, waiting for the I/O thread to register it
+        self.failures = 0  # Failed opens in a row, only the first one is logged
+        self.outgoing = deque()  # (message, enqueue time), written by the I/O thread
+        self.partial = b""  # Unwritten rest of the message being sent
+        self.enqueued = 0
+        self.incoming = queue.Queue(maxIncoming)  # Received messages, split like SerialObject.getData, oldest dropped
+        self.buffer = b""
+        self.latency = Histogram()  # Seconds from sendData until the last byte is handed to the port
+        self.stats = {"sent": 0, "received": 0, "bytesOut": 0, "bytesIn": 0, "dropped": 0, "receiveDropped": 0,
+                      "connects": 0, "disconnects": 0}
+
+    @property
+    def connected(self):
+
+        return self.ser is not None
+
+
+class SerialHub:
+
+    def __init__(self, baudRate=9600, digits=1, reconnectDelay=1.0, maxQueue=64, maxIncoming=256, opener=openSerial):
+
+        self.baudRate = baudRate
+        self.digits = digits
+        self.reconnectDelay = reconnectDelay  # Seconds between attempts to reopen lost or missing ports
+        self.maxQueue = maxQueue  # Outgoing messages kept per device, the oldest is dropped beyond that
+        self.maxIncoming = maxIncoming  # Unread received messages kept per device, the oldest is dropped beyond that
+        self.opener = opener  # opener(port, baudRate) -> object with fileno() and close(), e.g. a serial.Serial
+
+        self.devices = {}
+        self.lock = threading.Lock()
+        self.selector = selectors.DefaultSelector()  # Only ever touched by the I/O thread after this
+        self.commands = deque()  # Work for the I/O thread from other threads
+        self.wakeRead, self.wakeWrite = os.pipe()  # Wakes the selector when a command is posted
+        os.set_blocking(self.wakeRead, False)
+        os.set_blocking(self.wakeWrite, False)
+        self.selector.register(self.wakeRead, selectors.EVENT_READ, None)
+        self.running = True
+        self.stopped = threading.Event()  # Ends the reconnect thread's wait right away on close()
+        self.start = time.monotonic()
+
+        self.ioThread = threading.Thread(target=self.ioLoop, daemon=True)
+        self.reconnectThread = threading.Thread(target=self.reconnectLoop, daemon=True)
+        self.ioThread.start()
+        self.reconnectThread.start()
+
+    # ---- Devices ---- #
+
+    def add(self, name, port, baudRate=None, digits=None):
+
+        # A port that cannot be opened now is retried in the background
+        device = SerialDevice(name, port, baudRate or self.baudRate, digits or self.digits, self.maxQueue,
+                              self.maxIncoming)
+        # Marked as opening before the reconnect thread can see it, so the port is never opened twice
+        device.opening = True
+        with self.lock:
+            self.devices[name] = device
+        self.connect(device)
+        return device
+
+    def discover(self, match="Arduino", maxWorkers=8):
+
+        # One enumeration, then all matching ports are opened at the same time (opening resets an Arduino
+        # and can take a while). Names are the port's file name, e.g. "ttyACM0" or "COM3".
+        ports = [p for p in serial.tools.list_ports.comports() if match in p.description]
+        with ThreadPoolExecutor(max(1, min(maxWorkers, len(ports)))) as pool:
+            return list(pool.map(lambda p: self.add(os.path.basename(p.device), p.device), ports))
+
+    def connect(self, device):
+
+        with self.lock:
+            if not self.running:
+                device.opening = False
+                return False
+        device.opening = True
+        try:
+            ser = self.opener(device.port, device.baudRate)
+        except (OSError, serial.SerialException) as e:
+            device.opening = False
+            if device.failures == 0:
+                logger.warning("%s: could not open %s: %s, retrying in the background", device.name, device.port, e)
+            device.failures += 1
+            return False
+        if not self.post(("register", device, ser)):
+            # Closed while the port was opening
+            ser.close()
+            device.opening = False
+            return False
+        return True
+
+    def post(self, command):
+
+        # False once the hub is closed, the wake pipe may already be gone
+        with self.lock:
+            if not self.running:
+                return False
+            self.commands.append(command)
+            try:
+                os.write(self.wakeWrite, b"\0")
+            except BlockingIOError:
+                pass  # The pipe is full, the I/O thread is woken up already
+        return True
+
+    # ---- Sending and receiving ---- #
+
+    def sendData(self, name, data):
+
+        # Never blocks, the message is written by the I/O thread. False if the device is unknown.
+        device = self.devices.get(name)
+        if device is None:
+            return False
+        with self.lock:
+            if len(device.outgoing) >= device.maxQueue:
+                device.outgoing.popleft()
+                device.stats["dropped"] += 1
+            wasIdle = not device.outgoing
+            device.outgoing.append((encodeData(data, device.digits), time.perf_counter()))
+        if wasIdle:
+            self.post(("send", device, None))
+        return True
+
+    def getData(self, name, timeout=0):
+
+        # Oldest unread message from the device as a list of fields, None if there is none
+        device = self.devices[name]
+        try:
+            return device.incoming.get(timeout=timeout) if timeout else device.incoming.get_nowait()
+        except queue.Empty:
+            return None
+
+    # ---- I/O thread ---- #
+
+    def ioLoop(self):
+
+        while self.running:
+            for key, events in self.selector.select(timeout=1):
+                if key.data is None:
+                    try:
+                        os.read(self.wakeRead, 4096)
+                    except BlockingIOError:
+                        pass
+                    continue
+                device = key.data
+                if events & selectors.EVENT_READ:
+                    self.readDevice(device)
+                if events & selectors.EVENT_WRITE and device.connected:
+                    self.writeDevice(device)
+            while self.commands:
+                self.runCommand(*self.commands.popleft())
+
+    def runCommand(self, command, device, ser):
+
+        if command == "register":
+            device.ser, device.fd = ser, ser.fileno()
+            device.opening = False
+            device.failures = 0
+            device.stats["connects"] += 1
+            self.selector.register(device.fd, self.eventsFor(device), device)
+            logger.info("%s: connected on %s", device.name, device.port)
+        elif command == "send" and device.connected:
+            self.selector.modify(device.fd, self.eventsFor(device), device)
+
+    @staticmethod
+    def eventsFor(device):
+
+        return selectors.EVENT_READ | (selectors.EVENT_WRITE if device.outgoing or device.partial else 0)
+
+    def readDevice(self, device):
+
+        try:
+            chunk = os.read(device.fd, 4096)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self.disconnect(device, e)
+            return
+        if not chunk:
+            self.disconnect(device, "port closed")
+            return
+        device.stats["bytesIn"] += len(chunk)
+        device.buffer += chunk
+        # One message per line, fields are '#' terminated
+        *lines, device.buffer = device.buffer.split(b"\n")
+        for line in lines:
+            try:
+                message = line.decode("utf-8").split("#")[:-1]
+            except UnicodeDecodeError as e:
+                logger.error("%s: UnicodeDecodeError: %s", device.name, e)
+                continue
+            device.stats["received"] += 1
+            while True:
+                try:
+                    device.incoming.put_nowait(message)
+                    break
+                except queue.Full:
+                    # Nobody is reading this device fast enough, keep the newest messages
+                    try:
+                        device.incoming.get_nowait()
+                        device.stats["receiveDropped"] += 1
+                    except queue.Empty:
+                        pass
+
+    def writeDevice(self, device):
+
+        while True:
+            if not device.partial:
+                with self.lock:
+                    if not device.outgoing:
+                        break
+                    device.partial, device.enqueued = device.outgoing.popleft()
+            try:
+                n = os.write(device.fd, device.partial)
+            except BlockingIOError:
+                return
+            except OSError as e:
+                self.disconnect(device, e)
+                return
+            device.stats["bytesOut"] += n
+            device.partial = device.partial[n:]
+            if device.partial:
+                return  # The port's buffer is full, carry on when it is writable again
+            device.stats["sent"] += 1
+            device.latency.observe(time.perf_counter() - device.enqueued)
+        self.selector.modify(device.fd, self.eventsFor(device), device)
+
+    def disconnect(self, device, reason):
+
+        logger.warning("%s: disconnected (%s), reconnecting in the background", device.name, reason)
+        self.selector.unregister(device.fd)
+        try:
+            device.ser.close()
+        except OSError:
+            pass
+        device.ser = device.fd = None
+        device.partial = b""  # A half written message is lost with the port
+        device.buffer = b""
+        device.stats["disconnects"] += 1
+
+    # ---- Reconnecting ---- #
+
+    def reconnectLoop(self):
+
+        while not self.stopped.wait(self.reconnectDelay):
+            for device in list(self.devices.values()):
+                if not device.connected and not device.opening:
+                    self.connect(device)
+
+    # ---- Stats ---- #
+
+    def getStats(self):
+
+        # Per device counters, throughput since the hub started and send latency in milliseconds
+        elapsed = time.monotonic() - self.start
+        stats = {}
+        for name, device in list(self.devices.items()):
+            summary = device.latency.summary()
+            stats[name] = dict(device.stats, connected=device.connected, queued=len(device.outgoing),
+                               sentPerSec=device.stats["sent"] / elapsed,
+                               receivedPerSec=device.stats["received"] / elapsed,
+                               latencyMs={k: summary[k] * 1000 for k in ("mean", "p50", "p99", "max")})
+        return stats
+
+    def close(self):
+
+        with self.lock:
+            if not self.running:
+                return
+            self.running = False
+            try:
+                os.write(self.wakeWrite, b"\0")
+            except BlockingIOError:
+                pass
+        self.stopped.set()
+        self.ioThread.join()
+        self.reconnectThread.join()
+        # Ports opened after the I/O thread's last pass were never registered
+        for command, device, ser in self.commands:
+            if command == "register":
+                ser.close()
+        self.commands.clear()
+        for device in self.devices.values():
+            if device.connected:
+                device.ser.close()
+        self.selector.close()
+        os.close(self.wakeRead)
+        os.close(self.wakeWrite)
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *args):
+
+        self.close()
+
+
+def main():
+    import sys
+    import tty
+
+    # Without hardware: --pty simulates three Arduinos with pseudo terminals that echo every command back
+    if "--pty" in sys.argv:
+        hub = SerialHub(baudRate=115200, digits=3, reconnectDelay=0.5, opener=lambda port, baudRate: open(port, "r+b", 0))
+        masters = {}
+        for i in range(3):
+            master, slave = os.openpty()
+            tty.setraw(slave)
+            masters[f"arduino{i}"] = master
+            hub.add(f"arduino{i}", os.ttyname(slave))
+
+        def echo(master):
+            buffer = b""
+            while True:
+                try:
+                    buffer += os.read(master, 4096)
+                except OSError:
+                    return
+                *messages, buffer = buffer.split(b"$")
+                for m in filter(None, messages):
+                    os.write(master, m + b"#\n")
+        for master in masters.values():
+            threading.Thread(target=echo, args=(master,), daemon=True).start()
+    else:
+        hub = SerialHub(baudRate=9600, digits=1)
+        hub.discover()
+
+    time.sleep(1)
+    for count in range(200):
+        for name in hub.devices:
+            hub.sendData(name, [count % 10, 1])
+            data = hub.getData(name)
+            if data is not None:
+                print(name, data)
+        time.sleep(0.01)
+
+    for name, stats in hub.getStats().items():
+        print(name, stats)
+    hub.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import math
+import sys
+import time
+
+import cv2
+import numpy as np
+
+
+class EMAFilter:
+
+    def __init__(self, alpha=0.5):
+
+        self.alpha = alpha  # Weight of the newest sample, 1 means no smoothing
+        self.xPrev = None
+
+    def reset(self):
+
+        self.xPrev = None
+
+    def __call__(self, x, t=None):
+
+        x = np.asarray(x, dtype=np.float32)
+        if self.xPrev is None or self.xPrev.shape != x.shape:
+            self.xPrev = x.copy()
+            return self.xPrev.copy()
+
+        # xPrev += alpha * (x - xPrev), done in place on the whole landmark array
+        self.xPrev += self.alpha * (x - self.xPrev)
+        return self.xPrev.copy()
+
+
+class OneEuroFilter:
+
+    def __init__(self, minCutoff=1.0, beta=0.007, dCutoff=1.0):
+
+        self.minCutoff = minCutoff  # Cutoff (Hz) used when the landmarks are still, lower removes more jitter
+        self.beta = beta  # How fast the cutoff rises with speed, higher reduces lag on fast moves
+        self.dCutoff = dCutoff  # Cutoff (Hz) for the speed estimate
+        self.xPrev = None
+        self.dxPrev = None
+        self.tPrev = None
+
+    def reset(self):
+
+        self.xPrev = None
+        self.dxPrev = None
+        self.tPrev = None
+
+    @staticmethod
+    def alpha(cutoff, dt):
+
+        tau = 1.0 / (2 * math.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    def __call__(self, x, t=None):
+
+        x = np.asarray(x, dtype=np.float32)
+        t = time.time() if t is None else t
+
+        # First sample (or a different number of landmarks): start from it
+        if self.xPrev is None or self.xPrev.shape != x.shape:
+            self.xPrev = x.copy()
+            self.dxPrev = np.zeros_like(x)
+            self.tPrev = t
+            return self.xPrev.copy()
+
+        dt = t - self.tPrev
+        if dt <= 0:
+            return self.xPrev.copy()
+
+        # Smoothed speed of every coordinate
+        dx = (x - self.xPrev) / dt
+        self.dxPrev += self.alpha(self.dCutoff, dt) * (dx - self.dxPrev)
+
+        # Per-coordinate cutoff and blending factor, all as array operations
+        cutoff = self.minCutoff + self.beta * np.abs(self.dxPrev)
+        a = 1.0 / (1.0 + (1.0 / (2 * np.pi * cutoff)) / dt)
+        self.xPrev += a * (x - self.xPrev)
+        self.tPrev = t
+        return self.xPrev.copy()
+
+
+class LandmarkSmoother:
+
+    def __init__(self, mode="oneEuro", maxAge=1.0, **filterArgs):
+
+        if mode not in ("oneEuro", "ema"):
+            raise ValueError(f"Unknown smoothing mode '{mode}', use 'oneEuro' or 'ema'")
+        self.mode = mode
+        self.maxAge = maxAge  # Seconds a track may go unseen before its filter state is dropped
+        self.filterArgs = filterArgs
+        self.filters = {}
+        self.lastSeen = {}
+
+    def newFilter(self):
+
+        if self.mode == "ema":
+            return EMAFilter(**self.filterArgs)
+        return OneEuroFilter(**self.filterArgs)
+
+    def reset(self, key=None):
+
+        if key is None:
+            self.filters.clear()
+            self.lastSeen.clear()
+        else:
+            self.filters.pop(key, None)
+            self.lastSeen.pop(key, None)
+
+    def smooth(self, key, landmarks, t=None):
+
+        t = time.time() if t is None else t
+
+        # Forget tracks that disappeared so a returning hand/face doesn't drag in old positions
+        for oldKey in [k for k, seen in self.lastSeen.items() if t - seen > self.maxAge]:
+            self.reset(oldKey)
+
+        if key not in self.filters:
+            self.filters[key] = self.newFilter()
+        self.lastSeen[key] = t
+        return self.filters[key](landmarks, t)
+
+    def smoothHands(self, hands, t=None):
+
+        # Hands from HandDetector.findHands are tracked by their type ("Left"/"Right")
+        for hand in hands:
+            lm = self.smooth(hand["type"], hand["lmList"], t)
+            hand["lmList"] = np.rint(lm).astype(int).tolist()
+        return hands
+
+    def smoothFaces(self, faces, t=None):
+
+        # Faces from FaceMeshDetector.findFaceMesh are tracked by their index
+        for i, face in enumerate(faces):
+            lm = self.smooth(i, face, t)
+            faces[i] = np.rint(lm).astype(int).tolist()
+        return faces
+
+
+def measureJitter(track):
+
+    # Mean frame-to-frame acceleration of the landmarks, in pixels. On a still target this is pure jitter.
+    track = np.asarray(track, dtype=np.float32)
+    if len(track) < 3:
+        return 0.0
+    acc = track[2:] - 2 * track[1:-1] + track[:-2]
+    return float(np.linalg.norm(acc[..., :2], axis=-1).mean())
+
+
+def main():
+    from dejancv.HandTrackingModule import HandDetector
+
+    # Benchmark jitter vs. CPU for each setting. Pass a video of a still hand for reproducible numbers,
+    # otherwise the webcam is used.
+    source = sys.argv[1] if len(sys.argv) > 1 else 0
+    settings = [(1, None), (0, None), (0, "ema"), (0, "oneEuro")]
+    numFrames = 300
+
+    for complexity, mode in settings:
+        cap = cv2.VideoCapture(source)
+        detector = HandDetector(maxHands=1, modelComplexity=complexity)
+        smoother = LandmarkSmoother(mode=mode) if mode else None
+
+        track = []
+        frames = 0
+        detectTime = 0
+        smoothTime = 0
+        for i in range(numFrames):
+            success, img = cap.read()
+            if not success:
+                break
+
+            t0 = time.perf_counter()
+            hands, img = detector.findHands(img, draw=False)
+            t1 = time.perf_counter()
+            if hands:
+                lm = np.asarray(hands[0]["lmList"], dtype=np.float32)
+                if smoother:
+                    lm = smoother.smooth(hands[0]["type"], lm, t=i / 30)
+                track.append(lm)
+            t2 = time.perf_counter()
+
+            frames += 1
+            detectTime += t1 - t0
+            smoothTime += t2 - t1
+        cap.release()
+
+        frames = max(frames, 1)
+        print(f'complexity={complexity} smoothing={mode or "none":8s} '
+              f'jitter={measureJitter(track):6.2f}px '
+              f'detect={detectTime / frames * 1000:6.2f}ms '
+              f'smooth={smoothTime / frames * 1000:6.3f}ms')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+import numpy as np
+
+
+def iouMatrix(boxesA, boxesB):
+
+    # IoU of every box in A with every box in B, boxes as (x, y, w, h). Returns (len(A), len(B)).
+    a = np.asarray(boxesA, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxesB, dtype=np.float32).reshape(-1, 4)
+    ax1, ay1, ax2, ay2 = a[:, 0:1], a[:, 1:2], a[:, 0:1] + a[:, 2:3], a[:, 1:2] + a[:, 3:4]
+    bx1, by1, bx2, by2 = b[:, 0], b[:, 1], b[:, 0] + b[:, 2], b[:, 1] + b[:, 3]
+
+    interW = np.clip(np.minimum(ax2, bx2) - np.maximum(ax1, bx1), 0, None)
+    interH = np.clip(np.minimum(ay2, by2) - np.maximum(ay1, by1), 0, None)
+    inter = interW * interH
+    union = a[:, 2:3] * a[:, 3:4] + b[:, 2] * b[:, 3] - inter
+    return inter / np.maximum(union, 1e-6)
+
+
+def centerDistanceMatrix(boxesA, boxesB):
+
+    # Distance between box centers, divided by the size of the A box so it doesn't depend on the face size
+    a = np.asarray(boxesA, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxesB, dtype=np.float32).reshape(-1, 4)
+    ca = a[:, :2] + a[:, 2:] / 2
+    cb = b[:, :2] + b[:, 2:] / 2
+    dist = np.linalg.norm(ca[:, None, :] - cb[None, :, :], axis=-1)
+    return dist / np.maximum(np.sqrt(a[:, 2] * a[:, 3]), 1e-6)[:, None]
+
+
+def nms(boxes, scores, iouThreshold=0.3):
+
+    # Greedy non-maximum suppression, returns the indices of the boxes to keep, best score first
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    order = np.argsort(-np.asarray(scores, dtype=np.float32))
+    iou = iouMatrix(boxes, boxes)
+    keep = []
+    suppressed = np.zeros(len(boxes), dtype=bool)
+    for i in order:
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        suppressed |= iou[i] > iouThreshold
+    return np.array(keep, dtype=np.intp)
+
+
+def _hungarian(cost):
+
+    # Shortest augmenting path Hungarian algorithm for rows <= cols, the inner loop runs over all columns at once
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=np.intp)  # p[j]: row (1-based) assigned to column j
+    way = np.zeros(m + 1, dtype=np.intp)
+
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used[1:]
+            cur = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (cur < minv[1:])
+            minv[1:][better] = cur[better]
+            way[1:][better] = j0
+
+            candidates = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+
+            usedCols = np.flatnonzero(used)
+            u[p[usedCols]] += delta
+            v[usedCols] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+
+        # Flip the augmenting path
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    cols = np.flatnonzero(p[1:])
+    rows = p[1:][cols] - 1
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+def linearAssignment(cost):
+
+    # Minimum cost matching of rows to columns, returns (rows, cols). Uses SciPy when it is installed.
+    cost = np.asarray(cost, dtype=np.float64)
+    if cost.size == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    try:
+        from scipy.optimize import linear_sum_assignment
+        return linear_sum_assignment(cost)
+    except ImportError:
+        pass
+    if cost.shape[0] <= cost.shape[1]:
+        return _hungarian(cost)
+    cols, rows = _hungarian(cost.T)
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+class Track:
+
+    def __init__(self, id, bbox):
+
+        self.id = id
+        self.bbox = bbox
+        self.hits = 1  # Frames this track was matched
+        self.age = 0  # Frames since it was last matched
+        self.data = {}  # Per-identity results (recognition, classification, ...) kept for the life of the track
+
+
+class FaceTracker:
+
+    def __init__(self, maxAge=10, minIou=0.3, maxCenterDist=0.5, minHits=1):
+
+        self.maxAge = maxAge  # Frames a track survives without a matching detection
+        self.minIou = minIou  # Pairs below this IoU can still match if their centers are close
+        self.maxCenterDist = maxCenterDist  # In face sizes, for fast moves where boxes stop overlapping
+        self.minHits = minHits  # Matches needed before a track is reported
+        self.tracks = []
+        self.nextId = 0
+
+    def update(self, bboxs):
+
+        # bboxs: output of FaceDetector.findFaces. Returns the same list with "id" replaced by a stable track id.
+        boxes = np.array([b["bbox"] for b in bboxs], dtype=np.float32).reshape(-1, 4)
+        trackBoxes = np.array([t.bbox for t in self.tracks], dtype=np.float32).reshape(-1, 4)
+
+        matchedTracks, matchedDets = np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+        if len(boxes) and len(trackBoxes):
+            iou = iouMatrix(trackBoxes, boxes)
+            dist = centerDistanceMatrix(trackBoxes, boxes)
+            allowed = (iou >= self.minIou) | (dist <= self.maxCenterDist)
+
+            # Overlap first, center distance as tie breaker; pairs that are not allowed never win
+            cost = (1 - iou) + 0.1 * dist
+            cost[~allowed] = 1e6
+            rows, cols = linearAssignment(cost)
+            keep = allowed[rows, cols]
+            matchedTracks, matchedDets = rows[keep], cols[keep]
+
+        for t in self.tracks:
+            t.age += 1
+        for r, c in zip(matchedTracks, matchedDets):
+            track = self.tracks[r]
+            track.bbox = bboxs[c]["bbox"]
+            track.hits += 1
+            track.age = 0
+
+        detTracks = {}
+        for r, c in zip(matchedTracks, matchedDets):
+            detTracks[c] = self.tracks[r]
+        for c in np.setdiff1d(np.arange(len(bboxs)), matchedDets):
+            track = Track(self.nextId, bboxs[c]["bbox"])
+            self.nextId += 1
+            self.tracks.append(track)
+            detTracks[c] = track
+
+        self.tracks = [t for t in self.tracks if t.age <= self.maxAge]
+
+        tracked = []
+        for c, bboxInfo in enumerate(bboxs):
+            track = detTracks[c]
+            if track.hits >= self.minHits:
+                bboxInfo["id"] = track.id
+                tracked.append(bboxInfo)
+        return tracked
+
+    def getTrack(self, id):
+
+        for t in self.tracks:
+            if t.id == id:
+                return t
+        return None
+
+    def cached(self, id, key, compute):
+
+        # Run compute() once per identity and reuse the result while the track lives
+        track = self.getTrack(id)
+        if track is None:
+            return compute()
+        if key not in track.data:
+            track.data[key] = compute()
+        return track.data[key]
+
+
+def main():
+    import cv2
+    from dejancv.FaceDetectionModule import FaceDetector
+
+    cap = cv2.VideoCapture(0)
+    detector = FaceDetector(minDetectionCon=0.5)
+    tracker = FaceTracker(maxAge=15)
+
+    while True:
+        success, img = cap.read()
+        img, bboxs = detector.findFaces(img, draw=False)
+
+        # IDs now stay with the same person from frame to frame
+        bboxs = tracker.update(bboxs)
+
+        for bbox in bboxs:
+            x, y, w, h = bbox["bbox"]
+            # Expensive per-person work runs once per track, e.g. recognition on the first crop
+            name = tracker.cached(bbox["id"], "name", lambda: f'Person {bbox["id"]}')
+            cv2.rectangle(img, (x, y, w, h), (255, 0, 255), 2)
+            cv2.putText(img, name, (x, y - 10), cv2.FONT_HERSHEY_PLAIN, 2, (255, 0, 255), 2)
+
+        cv2.imshow("Image", img)
+        cv2.waitKey(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,13 @@
 
 import copy
-import urllib.request
+import functools
+import threading
+from collections import OrderedDict
 import cv2
 import numpy as np
 
+from dejancv import DrawModule
+
 
 def stackImages(_imgList, cols, scale):
 
@@ -43,22 +47,25 @@ def stackImages(_imgList, cols, scale):
 def cornerRect(img, bbox, l=30, t=5, rt=1,
                colorR=(255, 0, 255), colorC=(0, 255, 0)):
 
+    if not DrawModule.isEnabled():
+        return img
+
     x, y, w, h = bbox
     x1, y1 = x + w, y + h
     if rt != 0:
-        cv2.rectangle(img, bbox, colorR, rt)
+        DrawModule.rectangle(img, bbox, colorR, rt)
     # Top Left  x,y
-    cv2.line(img, (x, y), (x + l, y), colorC, t)
-    cv2.line(img, (x, y), (x, y + l), colorC, t)
+    DrawModule.line(img, (x, y), (x + l, y), colorC, t)
+    DrawModule.line(img, (x, y), (x, y + l), colorC, t)
     # Top Right  x1,y
-    cv2.line(img, (x1, y), (x1 - l, y), colorC, t)
-    cv2.line(img, (x1, y), (x1, y + l), colorC, t)
+    DrawModule.line(img, (x1, y), (x1 - l, y), colorC, t)
+    DrawModule.line(img, (x1, y), (x1, y + l), colorC, t)
     # Bottom Left  x,y1
-    cv2.line(img, (x, y1), (x + l, y1), colorC, t)
-    cv2.line(img, (x, y1), (x, y1 - l), colorC, t)
+    DrawModule.line(img, (x, y1), (x + l, y1), colorC, t)
+    DrawModule.line(img, (x, y1), (x, y1 - l), colorC, t)
     # Bottom Right  x1,y1
-    cv2.line(img, (x1, y1), (x1 - l, y1), colorC, t)
-    cv2.line(img, (x1, y1), (x1, y1 - l), colorC, t)
+    DrawModule.line(img, (x1, y1), (x1 - l, y1), colorC, t)
+    DrawModule.line(img, (x1, y1), (x1, y1 - l), colorC, t)
 
     return img
 
@@ -126,10 +133,8 @@ def overlayPNG(imgBack, imgFront, pos=[0, 0]):
     return imgBack
 
 
-def rotateImage(imgInput, angle, scale=1, keepSize=False):
-
-    # Get the dimensions of the input image (height and width)
-    h, w = imgInput.shape[:2]
+@functools.lru_cache(maxsize=256)
+def getRotation(h, w, angle, scale=1, keepSize=False):
 
     # Calculate the center of the original image
     center = (w / 2, h / 2)
@@ -152,49 +157,233 @@ def rotateImage(imgInput, angle, scale=1, keepSize=False):
         rotate_matrix[0, 2] += new_w / 2 - center[0]
         rotate_matrix[1, 2] += new_h / 2 - center[1]
 
+    # The result is cached and shared, so it must not be modified
+    rotate_matrix.flags.writeable = False
+    return rotate_matrix, (new_w, new_h)
+
+
+def rotateImage(imgInput, angle, scale=1, keepSize=False):
+
+    # Get the dimensions of the input image (height and width)
+    h, w = imgInput.shape[:2]
+
+    # Rotation matrix and output size, computed once per (size, angle, scale, keepSize)
+    rotate_matrix, (new_w, new_h) = getRotation(h, w, angle, scale, keepSize)
+
     # Perform the actual rotation and return the image
     imgOutput = cv2.warpAffine(src=imgInput, M=rotate_matrix, dsize=(new_w, new_h))
 
     return imgOutput
 
 
+def prepareInput(img, scale=1):
+
+    # RGB copy of the frame for MediaPipe, downscaled first when scale < 1 so the color conversion is cheaper too.
+    # Landmarks come back normalized, so callers map them with the original width and height.
+    if scale != 1:
+        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+
+class LabelCache:
+
+    def __init__(self, maxSize=256):
+
+        self.maxSize = maxSize  # Number of rendered labels kept, least recently used ones are evicted first
+        self.labels = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, render):
+
+        with self.lock:
+            label = self.labels.get(key)
+            if label is not None:
+                self.hits += 1
+                self.labels.move_to_end(key)
+                return label
+
+        # Render outside the lock, two threads rendering the same label just do it twice
+        label = render()
+        with self.lock:
+            self.misses += 1
+            self.labels[key] = label
+            while len(self.labels) > self.maxSize:
+                self.labels.popitem(last=False)
+        return label
+
+    def clear(self):
+
+        with self.lock:
+            self.labels.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# Shared by putTextRect and putTextCached
+labelCache = LabelCache()
+
+
+def renderLabel(x0, y0, x1, y1, drawFn, edgeColor):
+
+    # Render a label tile covering (x0, y0)-(x1, y1) relative to the text origin.
+    # drawFn(canvas, ox, oy) draws the label with its origin at (ox, oy). It is drawn once on black and
+    # once on white; the difference is how much of the background shows through each pixel
+    # (255 where nothing was drawn, 0 where the label is opaque, in between on anti-aliased edges).
+    # edgeColor is the color of the partly transparent pixels, the text color: only glyph edges are anti-aliased.
+    black = np.zeros((y1 - y0, x1 - x0, 3), np.uint8)
+    bgWeight = np.full_like(black, 255)
+    drawFn(black, -x0, -y0)
+    drawFn(bgWeight, -x0, -y0)
+    cv2.subtract(bgWeight, black, dst=bgWeight)
+
+    # OpenCV blends an anti-aliased pixel as (background * (255 - alpha) + color * alpha + 127) // 255.
+    # Keep color * alpha unrounded so blitLabel can repeat that exactly: opaque pixels are taken from the
+    # black canvas, edge pixels from the known edge color.
+    alpha = 255 - bgWeight.astype(np.int32)
+    colorWeight = np.where(alpha == 255, black.astype(np.int32) * 255, np.int32(edgeColor) * alpha)
+    return colorWeight, bgWeight, (x0, y0)
+
+
+def blitLabel(img, colorWeight, bgWeight, x, y):
+
+    # Draw a rendered label onto img with its top left corner at (x, y), clipped to the image, with the same
+    # integer blend as a direct draw. Opaque pixels and single anti-aliased edges come out identical; thick
+    # strokes (thickness > 1) overlap and OpenCV blends those edge pixels twice, there it can be one level off.
+    h, w = img.shape[:2]
+    th, tw = bgWeight.shape[:2]
+    x1, y1, x2, y2 = max(x, 0), max(y, 0), min(x + tw, w), min(y + th, h)
+    if x2 <= x1 or y2 <= y1:
+        return img
+
+    ty, tx = slice(y1 - y, y2 - y), slice(x1 - x, x2 - x)
+    region = img[y1:y2, x1:x2]
+    blend = region * bgWeight[ty, tx].astype(np.int32)
+    blend += colorWeight[ty, tx]
+    blend += 127
+    blend //= 255
+    region[:] = blend
+    return img
+
+
+def _canBlit(img):
+
+    return img.dtype == np.uint8 and img.ndim == 3 and img.shape[2] == 3
+
+
 def putTextRect(img, text, pos, scale=3, thickness=3, colorT=(255, 255, 255),
                 colorR=(255, 0, 255), font=cv2.FONT_HERSHEY_PLAIN,
-                offset=10, border=None, colorB=(0, 255, 0)):
+                offset=10, border=None, colorB=(0, 255, 0), useCache=True):
 
     ox, oy = pos
+
+    if useCache and _canBlit(img):
+        # Repeated labels are rendered once and then only copied in
+        def render():
+            (w, h), baseline = cv2.getTextSize(text, font, scale, thickness)
+            pad = max(thickness, border or 0) + 2
+
+            def draw(canvas, x, y):
+                cv2.rectangle(canvas, (x - offset, y + offset), (x + w + offset, y - h - offset), colorR, cv2.FILLED)
+                if border is not None:
+                    cv2.rectangle(canvas, (x - offset, y + offset), (x + w + offset, y - h - offset), colorB, border)
+                cv2.putText(canvas, text, (x, y), font, scale, colorT, thickness)
+
+            label = renderLabel(min(-offset, 0) - pad, -h - max(offset, 0) - pad,
+                                max(w + offset, w) + pad, max(offset, baseline) + thickness + pad, draw, colorT)
+            return label, (w, h)
+
+        key = ("rect", text, font, scale, thickness, tuple(colorT), tuple(colorR), offset, border, tuple(colorB))
+        if DrawModule.isEnabled():
+            (tile, bgWeight, (tx, ty)), (w, h) = labelCache.get(key, render)
+            DrawModule.call(blitLabel, img, tile, bgWeight, ox + tx, oy + ty)
+        else:
+            (w, h), _ = cv2.getTextSize(text, font, scale, thickness)
+        x1, y1, x2, y2 = ox - offset, oy + offset, ox + w + offset, oy - h - offset
+        return img, [x1, y2, x2, y1]
+
     (w, h), _ = cv2.getTextSize(text, font, scale, thickness)
 
     x1, y1, x2, y2 = ox - offset, oy + offset, ox + w + offset, oy - h - offset
 
-    cv2.rectangle(img, (x1, y1), (x2, y2), colorR, cv2.FILLED)
+    DrawModule.rectangle(img, (x1, y1), (x2, y2), colorR, cv2.FILLED)
     if border is not None:
-        cv2.rectangle(img, (x1, y1), (x2, y2), colorB, border)
-    cv2.putText(img, text, (ox, oy), font, scale, colorT, thickness)
+        DrawModule.rectangle(img, (x1, y1), (x2, y2), colorB, border)
+    DrawModule.putText(img, text, (ox, oy), font, scale, colorT, thickness)
 
     return img, [x1, y2, x2, y1]
 
 
-def downloadImageFromUrl(url, keepTransparency=False):
+def putTextCached(img, text, pos, font, scale, color, thickness=1):
 
-    # Download the image using urllib
-    url_response = urllib.request.urlopen(url)
+    # Same as cv2.putText, for labels that repeat from frame to frame
+    if not DrawModule.isEnabled():
+        return img
+    if not _canBlit(img):
+        return DrawModule.putText(img, text, pos, font, scale, color, thickness)
 
-    # Convert the downloaded bytes to a numpy array
-    image_data = np.asarray(bytearray(url_response.read()), dtype=np.uint8)
+    def render():
+        (w, h), baseline = cv2.getTextSize(text, font, scale, thickness)
+        pad = thickness + int(scale * 4) + 2
 
-    # Decode the image data
-    if keepTransparency:
-        image = cv2.imdecode(image_data, cv2.IMREAD_UNCHANGED)
-    else:
-        image = cv2.imdecode(image_data, cv2.IMREAD_COLOR)
+        def draw(canvas, x, y):
+            cv2.putText(canvas, text, (x, y), font, scale, color, thickness)
+
+        return renderLabel(-pad, -h - pad, w + pad, baseline + pad, draw, color)
+
+    key = ("text", text, font, scale, thickness, tuple(color))
+    tile, bgWeight, (tx, ty) = labelCache.get(key, render)
+    return DrawModule.call(blitLabel, img, tile, bgWeight, pos[0] + tx, pos[1] + ty)
+
+
+def checkLabelCache(trials=100, seed=0):
+
+    # Compare cached draws (putTextCached, putTextRect) with drawing directly on random backgrounds.
+    # Expected: every thickness 1 draw identical, the rest at most one level off on a few edge pixels.
+    rng = np.random.default_rng(seed)
+    fonts = (cv2.FONT_HERSHEY_PLAIN, cv2.FONT_HERSHEY_SIMPLEX, cv2.FONT_HERSHEY_COMPLEX)
+    result = {"draws": 0, "identical": 0, "thinIdentical": 0, "thinDraws": 0, "maxDifference": 0}
+    for i in range(trials):
+        img = rng.integers(0, 256, (120, 320, 3), np.uint8)
+        font = fonts[i % len(fonts)]
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        scale, thickness = float(rng.choice([1, 1.5, 2])), int(rng.integers(1, 4))
+        pos = (int(rng.integers(-20, 60)), int(rng.integers(20, 110)))  # Partly outside the image too
+        border = None if i % 2 else 3
 
-    return image
+        pairs = [img.copy() for _ in range(4)]
+        cv2.putText(pairs[0], "Label 42%", pos, font, scale, color, thickness)
+        putTextCached(pairs[1], "Label 42%", pos, font, scale, color, thickness)
+        putTextRect(pairs[2], "Label", pos, scale, thickness, color, (255, 0, 255), font, border=border, useCache=False)
+        putTextRect(pairs[3], "Label", pos, scale, thickness, color, (255, 0, 255), font, border=border, useCache=True)
+
+        for direct, cached in (pairs[:2], pairs[2:]):
+            difference = int(cv2.absdiff(direct, cached).max())
+            result["draws"] += 1
+            result["identical"] += difference == 0
+            result["maxDifference"] = max(result["maxDifference"], difference)
+            if thickness == 1:
+                result["thinDraws"] += 1
+                result["thinIdentical"] += difference == 0
+    return result
+
+
+def downloadImageFromUrl(url, keepTransparency=False):
+
+    # Downloaded through the shared DownloadModule.fetcher: repeated calls reuse its keep-alive connections
+    from dejancv.DownloadModule import fetcher
+
+    # Wrap the downloaded bytes in a numpy array without copying them, and decode the image data
+    return fetcher.decode(fetcher.fetchBytes(url), keepTransparency)
 
 
 def main():
     cap = cv2.VideoCapture(2)
 
+    # ------ putTextRect / putTextCached label cache ------#
+    print(f"Cached labels compared with direct drawing: {checkLabelCache()}")
+
     # ------ downloadImageFromUrl ------#
     imgPNG = downloadImageFromUrl(
         url='https://github.com/cvzone/cvzone/blob/master/Results/cvzoneLogo.png?raw=true',
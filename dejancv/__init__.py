@@ -1,2 +1,3 @@
 from dejancv.Utils import stackImages, cornerRect, findContours,\
-    overlayPNG, rotateImage, putTextRect,downloadImageFromUrl
+    overlayPNG, rotateImage, putTextRect,downloadImageFromUrl, putTextCached, labelCache
+from dejancv.DrawModule import setHeadless, setDeferred, render, renderOverlay
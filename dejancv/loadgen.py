@@ -0,0 +1,78 @@
+import argparse
+import http.client
+import threading
+import time
+import urllib.parse
+
+import numpy as np
+
+from dejancv.serve import decodeResult
+
+
+def client(url, body, deadline, latencies, errors):
+
+    # One keep-alive connection per client, frames are sent back to back like a camera that never waits
+    parts = urllib.parse.urlsplit(url)
+    path = parts.path + ("?" + parts.query if parts.query else "")
+    conn = http.client.HTTPConnection(parts.netloc, timeout=30)
+    headers = {"Content-Type": "image/jpeg"}
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            conn.request("POST", path, body, headers)
+            response = conn.getresponse()
+            data = response.read()
+            if response.status != 200:
+                raise IOError(f"{response.status} {data[:100]!r}")
+            decodeResult(data)
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            errors.append(str(e))
+            conn.close()
+            conn = http.client.HTTPConnection(parts.netloc, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+
+
+def run(url, body, clients=4, seconds=10, warmup=2):
+
+    # Warm-up requests build and warm the server's detectors before anything is measured
+    client(url, body, time.perf_counter() + warmup, [], [])
+
+    latencies, errors = [], []
+    deadline = time.perf_counter() + seconds
+    threads = [threading.Thread(target=client, args=(url, body, deadline, latencies, errors))
+               for _ in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {"clients": clients, "requests": len(latencies), "errors": len(errors),
+            "throughput": len(latencies) / elapsed, "p50Ms": float(np.percentile(ms, 50)),
+            "p99Ms": float(np.percentile(ms, 99)), "maxMs": float(ms.max())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for python -m dejancv.serve")
+    parser.add_argument("image", help="JPEG sent with every request")
+    parser.add_argument("--url", default="http://127.0.0.1:8700/hands", help="Endpoint, query parameters included")
+    parser.add_argument("--clients", default="1,2,4,8", help="Comma separated client counts to test")
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    with open(args.image, "rb") as f:
+        body = f.read()
+
+    print(f"{'clients':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'errors':>6}")
+    for clients in map(int, args.clients.split(",")):
+        r = run(args.url, body, clients, args.seconds)
+        print(f"{r['clients']:>7} {r['throughput']:8.1f} {r['p50Ms']:8.2f} {r['p99Ms']:8.2f} {r['maxMs']:8.2f} "
+              f"{r['errors']:>6}")
+
+
+if __name__ == "__main__":
+    main()
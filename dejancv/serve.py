@@ -0,0 +1,283 @@
+import argparse
+import json
+import math
+import struct
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+from dejancv import DrawModule, MetricsModule
+from dejancv.PoolModule import DetectorPool
+
+# Binary result: header, then count * points * dims float32 coordinates, then one float32 extra per item
+# (hand: 0 left / 1 right, face: score, classify: class index, others: 1). Coordinates are pixels of the
+# uploaded frame; faces are one (x, y, w, h) point each, a classification is one point per class.
+HEADER = struct.Struct("<4sBHHB")
+MAGIC = b"DCV1"
+
+# JPEG decoders can scale down by 2, 4 or 8 while decoding, far cheaper than decoding in full and resizing
+REDUCED = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+def encodeResult(points, extra=None):
+
+    points = np.ascontiguousarray(points, dtype="<f4")
+    count, numPoints, dims = points.shape
+    extra = np.ones(count, "<f4") if extra is None else np.asarray(extra, "<f4")
+    return HEADER.pack(MAGIC, 1, count, numPoints, dims) + points.tobytes() + extra.tobytes()
+
+
+def decodeResult(data):
+
+    # Returns (points (count, numPoints, dims), extra (count,))
+    magic, version, count, numPoints, dims = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a dejancv result")
+    size = count * numPoints * dims
+    points = np.frombuffer(data, "<f4", size, HEADER.size).reshape(count, numPoints, dims)
+    extra = np.frombuffer(data, "<f4", count, HEADER.size + size * 4)
+    return points, extra
+
+
+def jpegSize(data):
+
+    # (width, height) from the JPEG frame header, without decoding. None if data is not a JPEG.
+    if data[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        length = struct.unpack_from(">H", data, i + 2)[0]
+        # Start of frame markers (baseline, progressive, ...), DHT/JPG/DAC share the range but are no frames
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            h, w = struct.unpack_from(">HH", data, i + 5)
+            return w, h
+        i += 2 + length
+    return None
+
+
+def decodeFrame(body, scale=1):
+
+    # Returns (image, (width, height) of the uploaded frame, remaining scale). The image may be smaller:
+    # decoded at 1/2, 1/4 or 1/8 when scale allows it, the remaining factor is left to the detector's processScale.
+    data = np.frombuffer(body, np.uint8)
+    size = jpegSize(body)
+    flag, factor = cv2.IMREAD_COLOR, 1
+    if size is not None:
+        for f, reduced in REDUCED:
+            if scale * f <= 1:
+                flag, factor = reduced, f
+                break
+    img = cv2.imdecode(data, flag)
+    if img is None:
+        raise ValueError("Could not decode image")
+    if size is None:
+        size = (img.shape[1], img.shape[0])
+    return img, size, min(1.0, scale * factor)
+
+
+def landmarkArray(landmarkLists, numPoints, size):
+
+    w, h = size
+    if not landmarkLists:
+        return np.empty((0, numPoints, 3), np.float32)
+    lm = np.array([[(p.x, p.y, p.z) for p in lms.landmark] for lms in landmarkLists], np.float32)
+    return lm * np.array([w, h, w], np.float32)
+
+
+def runHands(detector, img, size):
+
+    hands, _ = detector.findHands(img, draw=False)
+    return (landmarkArray(detector.results.multi_hand_landmarks, 21, size),
+            [1.0 if hand["type"] == "Right" else 0.0 for hand in hands])
+
+
+def runPose(detector, img, size):
+
+    detector.findPose(img, draw=False)
+    landmarks = detector.results.pose_landmarks
+    return landmarkArray([landmarks] if landmarks else [], 33, size), None
+
+
+def runFaceMesh(detector, img, size):
+
+    detector.findFaceMesh(img, draw=False)
+    return landmarkArray(detector.results.multi_face_landmarks, 468, size), None
+
+
+def runFace(detector, img, size):
+
+    detector.findFaces(img, draw=False)
+    w, h = size
+    boxes, scores = [], []
+    for detection in detector.results.detections or []:
+        if detection.score[0] > detector.minDetectionCon:
+            box = detection.location_data.relative_bounding_box
+            boxes.append([box.xmin * w, box.ymin * h, box.width * w, box.height * h])
+            scores.append(detection.score[0])
+    return np.array(boxes, np.float32).reshape(-1, 1, 4), scores
+
+
+# endpoint -> (pool kind, runner, query parameters passed to the constructor, supports processScale)
+ENDPOINTS = {
+    "/hands": ("hands", runHands, {"maxHands": int, "modelComplexity": int}, True),
+    "/pose": ("pose", runPose, {"modelComplexity": int}, True),
+    "/faceMesh": ("faceMesh", runFaceMesh, {"maxFaces": int}, True),
+    "/face": ("face", runFace, {"modelSelection": int}, False),
+}
+
+
+class InferenceService:
+
+    def __init__(self, classifier=None, maxBatch=8, maxWait=0.005, maxIdle=16):
+
+        self.pool = DetectorPool(maxIdle=maxIdle)
+        self.batcher = None
+        if classifier is not None:
+            from dejancv.ClassificationModule import BatchingClassifier
+            self.batcher = BatchingClassifier(classifier, maxBatch, maxWait)
+
+    def detect(self, path, query, body):
+
+        kind, runner, params, scalable = ENDPOINTS[path]
+        scale = float(query.get("scale", 1))
+        if not math.isfinite(scale) or scale <= 0:
+            raise ValueError(f"scale must be a positive number, got {query['scale']}")
+        img, size, processScale = decodeFrame(body, scale)
+        kwargs = {name: cast(query[name]) for name, cast in params.items() if name in query}
+        if kind != "face":
+            # Frames from different clients interleave, so there is no tracking between requests
+            kwargs["staticMode"] = True
+
+        timer = MetricsModule.timer(f"serve{path}")
+        with self.pool.lease(kind, **kwargs) as detector:
+            if scalable:
+                detector.processScale = processScale
+            timer.lap("checkout")
+            points, extra = runner(detector, img, size)
+        timer.end("inference")
+        return encodeResult(points, extra)
+
+    def classify(self, body):
+
+        if self.batcher is None:
+            raise LookupError("No classifier loaded, start the server with --model")
+        img, _, _ = decodeFrame(body)
+        prediction, index = self.batcher.predict(img)
+        return encodeResult(np.asarray(prediction, np.float32).reshape(1, -1, 1), [index])
+
+    def getStats(self):
+
+        stats = {"pool": self.pool.getStats(), "metrics": MetricsModule.registry.toDict()}
+        if self.batcher is not None:
+            stats["batching"] = self.batcher.getStats()
+        return stats
+
+    def close(self):
+
+        if self.batcher is not None:
+            self.batcher.close()
+        self.pool.close()
+
+
+def makeHandler(service):
+
+    class InferenceHandler(BaseHTTPRequestHandler):
+
+        protocol_version = "HTTP/1.1"  # Keep-alive, clients reuse one connection for all their frames
+        disable_nagle_algorithm = True
+
+        def reply(self, status, body, contentType="application/octet-stream"):
+            self.send_response(status)
+            self.send_header("Content-Type", contentType)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            parts = urllib.parse.urlsplit(self.path)
+            query = dict(urllib.parse.parse_qsl(parts.query))
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            try:
+                if parts.path in ENDPOINTS:
+                    self.reply(200, service.detect(parts.path, query, body))
+                elif parts.path == "/classify":
+                    self.reply(200, service.classify(body))
+                else:
+                    self.reply(404, b"Unknown endpoint", "text/plain")
+            except (ValueError, LookupError) as e:
+                self.reply(400, str(e).encode(), "text/plain")
+            except Exception as e:
+                # Always answer, an unanswered request would break the client's keep-alive connection
+                self.reply(500, json.dumps({"error": f"{type(e).__name__}: {e}"}).encode(), "application/json")
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self.reply(200, json.dumps(service.getStats()).encode(), "application/json")
+            elif self.path == "/metrics":
+                self.reply(200, MetricsModule.registry.toPrometheus().encode(), "text/plain; version=0.0.4")
+            else:
+                self.reply(404, b"Unknown endpoint", "text/plain")
+
+        def log_message(self, *args):
+            pass
+
+    return InferenceHandler
+
+
+def createServer(host="127.0.0.1", port=8700, service=None):
+
+    service = InferenceService() if service is None else service
+    server = ThreadingHTTPServer((host, port), makeHandler(service))
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve dejancv detectors over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8700)
+    parser.add_argument("--model", help="Classifier model for /classify (.h5, .keras, .tflite or .onnx)")
+    parser.add_argument("--labels", help="Labels file for the classifier")
+    parser.add_argument("--max-batch", type=int, default=8, help="Largest classifier batch over all clients")
+    parser.add_argument("--max-wait", type=float, default=5, help="Milliseconds a request waits for a batch to fill")
+    parser.add_argument("--prewarm", default="", help="Comma separated detectors to build at start, e.g. hands,face")
+    parser.add_argument("--metrics", action="store_true", help="Record per-stage timings, see /metrics")
+    args = parser.parse_args()
+
+    # Nothing is drawn on the server
+    DrawModule.setHeadless()
+    if args.metrics:
+        MetricsModule.enable()
+
+    classifier = None
+    if args.model:
+        from dejancv.ClassificationModule import Classifier
+        classifier = Classifier(args.model, args.labels)
+    service = InferenceService(classifier, args.max_batch, args.max_wait / 1000)
+    for kind in filter(None, args.prewarm.split(",")):
+        if kind == "face":
+            service.pool.prewarm(kind)
+        else:
+            service.pool.prewarm(kind, staticMode=True)
+
+    server = createServer(args.host, args.port, service)
+    print(f"Serving on http://{args.host}:{server.server_port} ({', '.join(list(ENDPOINTS) + ['/classify'])})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    service.close()
+
+
+if __name__ == "__main__":
+    main()